@@ -0,0 +1,314 @@
+import asyncio
+import time
+import traceback
+import session_cache
+import discovery_cache
+import throttle
+import checkpoint
+from perf_report import span
+import config_and_utils
+from config_and_utils import log, set_log_account, set_log_context, update_account_status
+from history_tracker import is_already_completed, save_completion
+from ipo_discovery import parse_applicable_issues
+from application_logic import match_bank, record_outcome
+import outcomes
+
+# Browserless engine: talks to the JSON backend behind the Meroshare SPA directly.
+# All accounts share one pooled httpx client; each account only keeps its auth token.
+
+APPLICABLE_ISSUE_QUERY = {
+    "filterFieldParams": [
+        {"key": "companyIssue.companyISIN.script", "alias": "Scrip"},
+        {"key": "companyIssue.companyISIN.company.name", "alias": "Company Name"},
+        {"key": "companyIssue.assignedToClient.name", "value": "", "alias": "Issue Manager"},
+    ],
+    "page": 1,
+    "size": 200,
+    "searchRoleViewConstants": "VIEW_APPLICABLE_SHARE",
+    "filterDateParams": [
+        {"key": "minIssueOpenDate", "condition": "", "alias": "", "value": ""},
+        {"key": "maxIssueCloseDate", "condition": "", "alias": "", "value": ""},
+    ],
+}
+
+class ApiError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class MeroshareApiClient:
+    """One logged-in Meroshare session on top of a shared httpx.AsyncClient."""
+
+    def __init__(self, http, base_url=None):
+        self.http = http
+        self.base_url = (base_url or config_and_utils.API_URL).rstrip("/")
+        self.token = None
+        self.own_detail = None
+        self.bank_choice = None
+
+    async def request(self, method, path, json=None):
+        headers = {"Authorization": self.token} if self.token else {}
+        pacing = throttle.scheduler()
+        await pacing.acquire()
+        start = time.perf_counter()
+        try:
+            resp = await self.http.request(method, f"{self.base_url}{path}", json=json, headers=headers)
+        except Exception:
+            pacing.record(False)
+            raise
+        # 4xx is about this request (wrong PIN, expired token); 5xx and 429 mean the server is struggling
+        pacing.record(resp.status_code < 500 and resp.status_code != 429, time.perf_counter() - start)
+        try:
+            data = resp.json()
+        except ValueError:
+            data = {}
+        if resp.status_code >= 400:
+            message = data.get("message") if isinstance(data, dict) else None
+            raise ApiError(message or f"HTTP {resp.status_code} on {path}", resp.status_code)
+        return resp, data
+
+    async def resolve_client_id(self, dp_id):
+        _, capitals = await self.request("GET", "/meroShare/capital/")
+        wanted = str(dp_id).strip().lower()
+        for cap in capitals:
+            if wanted in (str(cap.get("code", "")).lower(), str(cap.get("id", "")).lower()):
+                return cap["id"]
+        for cap in capitals:
+            if wanted and wanted in str(cap.get("name", "")).lower():
+                return cap["id"]
+        raise ApiError(f"DP '{dp_id}' not found")
+
+    async def login(self, account):
+        client_id = await self.resolve_client_id(account['dp_id'])
+        resp, _ = await self.request("POST", "/meroShare/auth/", json={
+            "clientId": client_id,
+            "username": account['username'],
+            "password": account['password'],
+        })
+        self.token = resp.headers.get("Authorization")
+        if not self.token:
+            raise ApiError("No auth token in login response")
+        _, self.own_detail = await self.request("GET", "/meroShare/ownDetail/")
+        return True
+
+    async def applicable_issues(self):
+        _, data = await self.request("POST", "/meroShare/companyShare/applicableIssue/", json=APPLICABLE_ISSUE_QUERY)
+        return parse_applicable_issues(data)
+
+    async def banks(self):
+        _, data = await self.request("GET", "/meroShare/bank/")
+        return [{"text": b.get("name", "").strip(), "value": str(b["id"])} for b in data]
+
+    async def bank_accounts(self, bank_id):
+        _, data = await self.request("GET", f"/meroShare/bank/{bank_id}")
+        return data if isinstance(data, list) else [data]
+
+    async def apply(self, issue_id, bank_id, bank_account, crn, pin, kitta="10"):
+        _, data = await self.request("POST", "/meroShare/applicantForm/share/apply", json={
+            "demat": self.own_detail.get("demat"),
+            "boid": self.own_detail.get("boid"),
+            "accountNumber": bank_account.get("accountNumber"),
+            "customerId": bank_account.get("id"),
+            "accountBranchId": bank_account.get("accountBranchId"),
+            "accountTypeId": bank_account.get("accountTypeId"),
+            "appliedKitta": kitta,
+            "crnNumber": crn,
+            "transactionPIN": pin,
+            "companyShareId": str(issue_id),
+            "bankId": bank_id,
+        })
+        return data.get("message", "") if isinstance(data, dict) else ""
+
+async def api_login(client, account):
+    """True when logged in, False when the credentials were rejected, None when the server or network failed."""
+    entry = await session_cache.load_session(account['username'], kind="api")
+    if entry:
+        client.token = entry.get("token")
+        try:
+            _, client.own_detail = await client.request("GET", "/meroShare/ownDetail/")
+            session_cache.record_hit()
+            log(f"Reused saved session: {account['name']}")
+            return True
+        except Exception:
+            session_cache.record_stale()
+            client.token = None
+
+    log(f"Logging in (API): {account['name']}")
+    try:
+        with span("login", account=account['name']):
+            await client.login(account)
+        await session_cache.save_session(account['username'], {"token": client.token}, kind="api")
+        log("Login OK.")
+        update_account_status(account['username'], "credentials_correct", True)
+        return True
+    except ApiError as e:
+        if e.status is not None and (e.status >= 500 or e.status == 429):
+            log(f"Login Error: {e}")
+            return None
+        log(f"Login Failed: {e}")
+        update_account_status(account['username'], "credentials_correct", False)
+        return False
+    except Exception as e:
+        log(f"Login Error: {e}")
+        return None
+
+async def api_apply(client, account, ipo):
+    """Apply for `ipo` and return its result (see outcomes.py)."""
+    log(f"Processing {ipo['company']} for {account['name']}...")
+    boid = (client.own_detail or {}).get("boid", "")
+    if ipo.get("state") == "edit":
+        log(f"{ipo['company']} already applied (Edit mode). Skipping.")
+        await save_completion(
+            account['name'],
+            account['username'],
+            boid,
+            ipo['company'],
+            ipo['url'],
+            crn=account.get('crn'),
+            active=account.get('active', True),
+            selected_bank="Already Applied (N/A)",
+            available_banks=[]
+        )
+        return outcomes.result(ipo, outcomes.ALREADY_APPLIED, "Edit mode")
+
+    try:
+        # Bank and linked account rarely change between IPOs, so resolve them once per session
+        if client.bank_choice is None:
+            with span("bank_scrape"):
+                banks = await client.banks()
+            account['available_banks_list'] = [b['text'] for b in banks]
+            bank = match_bank(account['bank_name'], banks) or (banks[0] if banks else None)
+            if not bank:
+                log("No banks found.")
+                return outcomes.result(ipo, outcomes.ERROR, "No banks found")
+            account['selected_bank_name'] = bank['text']
+            with span("account_select"):
+                bank_accounts = await client.bank_accounts(bank['value'])
+            if not bank_accounts:
+                log("No bank account linked.")
+                return outcomes.result(ipo, outcomes.ERROR, "No bank account linked")
+            client.bank_choice = (bank, bank_accounts)
+        bank, bank_accounts = client.bank_choice
+
+        with span("submit"):
+            message = await client.apply(ipo['issue_id'], bank['value'], bank_accounts[0], account['crn'], account['pin'])
+        log(f"RESPONSE: {message}")
+    except ApiError as e:
+        message = str(e)
+        log(f"RESPONSE: {message}")
+        # The cached bank may be the cause; resolve it again for the next IPO
+        client.bank_choice = None
+    except Exception as e:
+        log(f"Global App Error: {e}")
+        return outcomes.result(ipo, outcomes.ERROR, f"Error: {e}")
+
+    res = outcomes.result(ipo, outcomes.classify(message), message)
+    await record_outcome(account, ipo, res, boid)
+    return res
+
+async def process_account(http, acc, available_ipos, client=None, base_url=None):
+    set_log_account(acc['name'])
+    results = []
+    to_do = [ipo for ipo in available_ipos if not is_already_completed(acc['username'], ipo['company'])
+             and not checkpoint.settled(acc['username'], ipo['company'])]
+    if not to_do:
+        log(f"All available IPOs already applied for {acc['name']}. Skipping.")
+        return results
+
+    log(f"Processing {len(to_do)} IPOs for {acc['name']}...")
+    try:
+        if client is None:
+            set_log_context(stage="login")
+            client = MeroshareApiClient(http, base_url)
+            logged_in = await api_login(client, acc)
+            if not logged_in:
+                log(f"Login failed for {acc['name']}. Skipping.")
+                # Server trouble rather than bad credentials goes to the requeue
+                outcome = outcomes.ERROR if logged_in is None else outcomes.LOGIN_REJECTED
+                results = [outcomes.result(ipo, outcome, "Login failed") for ipo in to_do]
+                checkpoint.record_all(acc['username'], results)
+                return results
+        # Issue state ("apply"/"edit") is per account, so re-read it with this session
+        states = {i['issue_id']: i for i in await client.applicable_issues()}
+        for ipo in to_do:
+            set_log_context(ipo=ipo['company'], stage="apply")
+            res = await api_apply(client, acc, {**ipo, **states.get(ipo['issue_id'], {})})
+            results.append(res)
+            checkpoint.record(acc['username'], res)
+            if res['outcome'] == outcomes.WRONG_PIN:
+                log(f"Skipping remaining IPOs for {acc['name']} until the PIN is fixed.")
+                break
+    except Exception:
+        log(f"Worker error for {acc['name']}: {traceback.format_exc()}", level="ERROR")
+        tried = {r['company'] for r in results}
+        failed = [outcomes.result(ipo, outcomes.ERROR, "Worker error") for ipo in to_do if ipo['company'] not in tried]
+        checkpoint.record_all(acc['username'], failed)
+        results += failed
+    return results
+
+def http_client(max_concurrency=1):
+    import httpx
+    limits = httpx.Limits(max_connections=max_concurrency * 2, max_keepalive_connections=max_concurrency * 2)
+    return httpx.AsyncClient(limits=limits, timeout=30.0)
+
+async def discover_with(client, acc):
+    """Log in `acc` on `client` and return the open IPOs ([] on failure)."""
+    log(f"Using {acc['name']} to check for available IPOs...")
+    if not await api_login(client, acc):
+        log("Initial login failed. Cannot proceed to discovery.")
+        return []
+    try:
+        with span("discovery", account=acc['name']):
+            available_ipos = await client.applicable_issues()
+    except Exception as e:
+        log(f"Discovery Error: {e}")
+        return []
+    for ipo in available_ipos:
+        log(f"Valid IPO Target Found: {ipo['company']} ({ipo['share_type']}) -> {ipo['url']}")
+    await discovery_cache.save_ipos(available_ipos)
+    return available_ipos
+
+async def discover_only(acc, base_url=None):
+    async with http_client() as http:
+        return discovery_cache.shared_ipos(await discover_with(MeroshareApiClient(http, base_url), acc))
+
+async def apply_all(http, accounts, available_ipos, max_concurrency=1, first=None, base_url=None):
+    """Run process_account for every account; `first` is a logged-in client for accounts[0]."""
+    semaphore = asyncio.Semaphore(max(1, int(max_concurrency or 1)))
+
+    async def run_one(acc, ipos, attempt):
+        async with semaphore:
+            return await process_account(http, acc, ipos, first if acc is accounts[0] else None, base_url)
+
+    # process_account re-reads apply/edit state per account, so everyone starts from the shared list
+    available_ipos = discovery_cache.shared_ipos(available_ipos)
+    checkpoint.plan(accounts, available_ipos)
+    # Failed (account, IPO) pairs are retried once the first pass is done
+    results = await throttle.run_with_requeue(accounts, available_ipos, run_one)
+    return sum(len(r) for r in results)
+
+async def main(max_concurrency=1, base_url=None, accounts=None, available_ipos=None):
+    log("=== Meroshare Bot Started (API mode) ===")
+    if accounts is None:
+        accounts = config_and_utils.active_accounts()
+    active_accounts = accounts
+    if not active_accounts:
+        log("No active accounts found in accounts.csv")
+        return
+
+    max_concurrency = max(1, int(max_concurrency or 1))
+    async with http_client(max_concurrency) as http:
+        # 1. Use the first account to discover available IPOs (unless handed a list)
+        first = None
+        if available_ipos is None:
+            first = MeroshareApiClient(http, base_url)
+            available_ipos = await discover_with(first, active_accounts[0])
+        if not available_ipos:
+            log("No available IPOs found or error during discovery.")
+            return
+
+        applied = await apply_all(http, active_accounts, available_ipos, max_concurrency, first, base_url)
+        log(f"Processed {applied} applications across {len(active_accounts)} accounts.")
+        log(session_cache.summary())
+        log(throttle.scheduler().summary())
+        log("=== Meroshare Bot Finished ===")
@@ -1,6 +1,12 @@
 import asyncio
-from config_and_utils import log, update_account_status
+import session_cache
+import waits
+import throttle
+import artifacts
+from perf_report import span
+from config_and_utils import APP_URL, log, update_account_status, save_account_banks
 from history_tracker import save_completion
+import outcomes
 
 # Expert Playwright Helpers (inspired by playwright-skill)
 async def safe_click(page, selector, timeout=15000, retries=2):
@@ -14,7 +20,8 @@ async def safe_click(page, selector, timeout=15000, retries=2):
                 log(f"Final click failure on {selector}: {e}")
                 return False
             log(f"Retry click on {selector} ({i+1}/{retries})...")
-            await asyncio.sleep(2)
+            throttle.scheduler().stats["retries"] += 1
+            await asyncio.sleep(throttle.scheduler().backoff(i))
 
 async def safe_fill(page, selector, value, timeout=15000):
     try:
@@ -25,91 +32,163 @@ async def safe_fill(page, selector, value, timeout=15000):
         log(f"Fill failure on {selector}: {e}")
         return False
 
-async def setup_toast_monitor(page, account, company_name, boid, url):
-    async def handle_toast(text):
-        clean_text = text.strip()
-        if not clean_text: return
-        log(f"[{account['name']}] TOAST: {clean_text}")
-        if "successfully" in clean_text.lower():
-            await save_completion(
-                account['name'], 
-                account['username'], 
-                boid, 
-                company_name, 
-                url,
-                crn=account.get('crn'),
-                active=account.get('active', True),
-                selected_bank=account.get('selected_bank_name'),
-                available_banks=account.get('available_banks_list')
-            )
+def match_bank(bank_name, options):
+    """Pick the option whose text contains the account's bank name, or None."""
+    wanted = (bank_name or "").lower()
+    for item in options:
+        text = item['text'].lower()
+        if wanted in text or ("nic asia" in wanted and "nic asia" in text):
+            return item
+    return None
+
+# Bank choice per username, reused for every later IPO of the same account in this run:
+# {"value", "text", "account_index", "banks"}
+BANK_CACHE = {}
+
+BANK_OPTIONS_JS = "opts => opts.map(o => ({ value: o.value, text: o.innerText }))"
+
+async def resolve_bank(page, account):
+    """Pick the bank option for `account` on the current apply page.
+
+    Uses the cached choice when its value is still offered in `#selectBank`;
+    otherwise reads all options in one call, matches the bank and caches it.
+    """
+    cached = BANK_CACHE.get(account['username'])
+    if cached:
+        if await page.locator(f"#selectBank option[value='{cached['value']}']").count():
+            account['available_banks_list'] = cached['banks']
+            account['selected_bank_name'] = cached['text']
+            return cached
+        log("Cached bank no longer offered. Re-reading bank list.")
+        BANK_CACHE.pop(account['username'], None)
+
+    valid_list = []
+    for opt in await page.eval_on_selector_all("#selectBank option", BANK_OPTIONS_JS):
+        if opt['value']:
+            text = opt['text'].strip().replace("\n", " ").replace("\r", " ")
+            valid_list.append({"text": text.encode('ascii', 'ignore').decode('ascii'), "value": opt['value']})
+    if not valid_list:
+        return None
+
+    # Store for output
+    account['available_banks_list'] = [b['text'] for b in valid_list]
+    save_account_banks(account['username'], valid_list)
+
+    # Match Bank
+    item = match_bank(account['bank_name'], valid_list)
+    if item:
+        log(f"Matched Bank: {item['text']}")
+    else:
+        item = valid_list[0]
+        log(f"Fallback to first bank: {item['text']}")
+    account['selected_bank_name'] = item['text']
+
+    choice = {"value": item['value'], "text": item['text'], "account_index": None, "banks": account['available_banks_list']}
+    BANK_CACHE[account['username']] = choice
+    return choice
+
+async def record_outcome(account, ipo, res, boid=""):
+    """Write history and account status for one application result."""
+    outcome = res['outcome']
+    if outcome in (outcomes.SUCCESS, outcomes.ALREADY_APPLIED):
+        await save_completion(
+            account['name'],
+            account['username'],
+            boid,
+            ipo['company'],
+            ipo['url'],
+            crn=account.get('crn'),
+            active=account.get('active', True),
+            selected_bank=account.get('selected_bank_name'),
+            available_banks=account.get('available_banks_list')
+        )
+        if outcome == outcomes.SUCCESS:
             update_account_status(account['username'], "pin_correct", True)
-        
-        if "wrong transaction pin" in clean_text.lower():
-            log(f"ALERT: Wrong PIN detected for {account['name']}")
-            update_account_status(account['username'], "pin_correct", False)
-    
-    try: 
-        await page.expose_function("reportToast", handle_toast)
-    except: 
-        pass 
-
-    await page.evaluate("""
-        if (window.toastObserver) window.toastObserver.disconnect();
-        window.toastObserver = new MutationObserver((mutations) => {
-            for (const mutation of mutations) {
-                for (const node of mutation.addedNodes) {
-                    if (node.nodeType === 1) {
-                        const selector = '.toast-message, .toastr, [role="alert"]';
-                        if (node.matches(selector)) window.reportToast(node.innerText);
-                        node.querySelectorAll(selector).forEach(t => window.reportToast(t.innerText));
-                    }
-                }
-            }
-        });
-        window.toastObserver.observe(document.body, { childList: true, subtree: true });
-    """)
+    elif outcome == outcomes.WRONG_PIN:
+        log(f"ALERT: Wrong PIN detected for {account['name']}", level="WARNING")
+        update_account_status(account['username'], "pin_correct", False)
 
 async def login(page, account):
+    """True when logged in, False when the site rejected the login, None when the page itself failed."""
     log(f"Logging in: {account['name']}")
-    try:
-        await page.goto("https://meroshare.cdsc.com.np/#/login", wait_until="networkidle")
-        await page.wait_for_selector(".select2-selection--single")
-        await page.click(".select2-selection--single")
-        await page.wait_for_selector(".select2-search__field")
-        await page.fill(".select2-search__field", account['dp_id'])
-        await page.press(".select2-search__field", "Enter")
-        await page.fill("#username", account['username'])
-        await page.fill("#password", account['password'])
-        await page.click("button.sign-in")
-        
-        # Wait for either Dashboard or an error message
+    with span("login", account=account['name']) as login_span:
         try:
-            await page.wait_for_selector("a:has-text('Dashboard')", timeout=20000)
-            log("Login OK.")
-            update_account_status(account['username'], "credentials_correct", True)
-            return True
-        except:
-            if "Dashboard" in (await page.content()):
+            await throttle.scheduler().acquire()
+            await page.goto(f"{APP_URL}/#/login", wait_until="networkidle")
+            with span("dp_select", account=account['name']):
+                if not await safe_click(page, ".select2-selection--single"):
+                    raise RuntimeError("DP selector not clickable")
+                await page.wait_for_selector(".select2-search__field")
+                await page.fill(".select2-search__field", account['dp_id'])
+                await page.press(".select2-search__field", "Enter")
+            await page.fill("#username", account['username'])
+            await page.fill("#password", account['password'])
+            if not await safe_click(page, "button.sign-in"):
+                raise RuntimeError("Sign-in button not clickable")
+
+            # Wait for either Dashboard or an error message
+            try:
+                await page.wait_for_selector("a:has-text('Dashboard')", timeout=20000)
+                log("Login OK.")
                 update_account_status(account['username'], "credentials_correct", True)
                 return True
-            log("Login Failed.")
-            update_account_status(account['username'], "credentials_correct", False)
-            return False
+            except:
+                if "Dashboard" in (await page.content()):
+                    update_account_status(account['username'], "credentials_correct", True)
+                    return True
+                log("Login Failed.")
+                update_account_status(account['username'], "credentials_correct", False)
+                login_span.fail()
+                return False
+        except Exception as e:
+            log(f"Login Error: {e}")
+            login_span.fail()
+            return None
+
+async def login_with_cache(page, account):
+    """Reuse a cached session for this account when it is still valid, else do a full `login`."""
+    entry = await session_cache.load_session(account['username'])
+    if entry:
+        await session_cache.restore_browser_session(page, entry)
+        try:
+            await throttle.scheduler().acquire()
+            await page.goto(f"{APP_URL}/#/dashboard", wait_until="domcontentloaded")
+            await page.wait_for_selector("a:has-text('Dashboard')", timeout=8000)
+            session_cache.record_hit()
+            log(f"Reused saved session: {account['name']}")
+            return True
+        except Exception:
+            log("Saved session expired. Logging in again.")
+            session_cache.record_stale()
+            await session_cache.drop_session(account['username'])
+
+    logged_in = await login(page, account)
+    if not logged_in:
+        return logged_in
+    try:
+        await session_cache.save_session(account['username'], await session_cache.capture_browser_session(page))
     except Exception as e:
-        log(f"Login Error: {e}")
-        return False
+        log(f"Could not save session: {e}")
+    return True
 
 async def apply_process(page, account, ipo):
+    """Apply for `ipo` and return its result (see outcomes.py) as soon as the site reports it."""
     log(f"Processing {ipo['company']} for {account['name']}...")
+    # A capture of the previous IPO's failure must see that page, not this one
+    await artifacts.settle(page)
     try:
+        channel = await outcomes.outcome_channel(page)
+
         # 1. Navigate to Application
+        await throttle.scheduler().acquire()
         await page.goto(ipo['url'], wait_until="domcontentloaded")
-        await asyncio.sleep(5)
+        await waits.wait_for_application_page(page)
         
         # Verify Navigation
         if "/asba/apply/" not in page.url and "/asba/edit/" not in page.url:
             log(f"Wrong page: {page.url}. Attempting manual navigation...")
-            await page.goto("https://meroshare.cdsc.com.np/#/asba", wait_until="networkidle")
+            await throttle.scheduler().acquire()
+            await page.goto(f"{APP_URL}/#/asba", wait_until="networkidle")
             # Search and click Apply
             rows = await page.query_selector_all("tr, .company-list")
             clicked = False
@@ -123,11 +202,9 @@ async def apply_process(page, account, ipo):
                         break
             if not clicked or ("/asba/apply/" not in page.url and "/asba/edit/" not in page.url):
                 log("Manual navigation failed. Skipping.")
-                return
+                return outcomes.result(ipo, outcomes.ERROR, "Application page not reachable")
 
         # 2. Check State
-        if "/asba/edit/" in page.url:
-            log(f"{ipo['company']} already applied (Edit mode). Skipping.")
         if "/asba/edit/" in page.url:
             log(f"{ipo['company']} already applied (Edit mode). Skipping.")
             await save_completion(
@@ -141,102 +218,91 @@ async def apply_process(page, account, ipo):
                 selected_bank="Already Applied (N/A)",
                 available_banks=[]
             )
-            return
-            return
+            return outcomes.result(ipo, outcomes.ALREADY_APPLIED, "Edit mode")
 
         # 3. Bank and Account Selection
         log(f"Selecting Bank: {account['bank_name']}")
         try:
-            await page.wait_for_selector("#selectBank", state="visible", timeout=20000)
-            # Give it time for AJAX options
-            await asyncio.sleep(3)
-            
-            options = await page.query_selector_all("#selectBank option")
-            val = None
-            valid_list = []
-            for opt in options:
-                v = await opt.get_attribute("value")
-                t = (await opt.inner_text()).strip().replace("\n", " ").replace("\r", " ")
-                if v:
-                    safe_text = t.encode('ascii', 'ignore').decode('ascii')
-            for opt in options:
-                v = await opt.get_attribute("value")
-                t = (await opt.inner_text()).strip().replace("\n", " ").replace("\r", " ")
-                if v:
-                    safe_text = t.encode('ascii', 'ignore').decode('ascii')
-                    valid_list.append({"text": safe_text, "value": v})
-            
-            # Store for output
-            account['available_banks_list'] = [b['text'] for b in valid_list]
-            
-            # Save banks to CSV
-            from config_and_utils import save_account_banks
-            save_account_banks(account['username'], valid_list)
-
-            # Match Bank
-            for item in valid_list:
-                if account['bank_name'].lower() in item['text'].lower() or ("nic asia" in account['bank_name'].lower() and "nic asia" in item['text'].lower()):
-                    val = item['value']
-                if account['bank_name'].lower() in item['text'].lower() or ("nic asia" in account['bank_name'].lower() and "nic asia" in item['text'].lower()):
-                    val = item['value']
-                    log(f"Matched Bank: {item['text']}")
-                    account['selected_bank_name'] = item['text']
-                    break
-            
-            if not val and valid_list:
-                val = valid_list[0]['value']
-            if not val and valid_list:
-                val = valid_list[0]['value']
-                log(f"Fallback to first bank: {valid_list[0]['text']}")
-                account['selected_bank_name'] = valid_list[0]['text']
-
-            if val:
-                await page.select_option("#selectBank", value=val)
-                # Important: Trigger change event
-                await page.evaluate("document.querySelector('#selectBank').dispatchEvent(new Event('change', { bubbles: true }))")
-                
-                # Wait for Account list
-                log("Waiting for account list...")
-                await asyncio.sleep(5)
-                # Find the account dropdown (not selectBank)
-                account_dropdown = page.locator("select:not(#selectBank)")
-                await account_dropdown.wait_for(state="attached", timeout=15000)
-                # Wait for at least one valid option
-                await page.wait_for_selector("select:not(#selectBank) option[value]:not([value=''])", state="attached", timeout=10000)
-                
-                await account_dropdown.select_option(index=1)
-                await page.evaluate("document.querySelector('select:not(#selectBank)').dispatchEvent(new Event('change', { bubbles: true }))")
+            with span("bank_scrape") as bank_span:
+                await page.wait_for_selector("#selectBank", state="visible", timeout=20000)
+                # Options arrive over AJAX after the select itself renders
+                await waits.wait_for_options(page, "#selectBank")
+                choice = await resolve_bank(page, account)
+                if not choice:
+                    bank_span.fail()
+
+            if choice:
+                val = choice['value']
+                with span("account_select"):
+                    await page.select_option("#selectBank", value=val)
+                    # Important: Trigger change event
+                    await page.evaluate("document.querySelector('#selectBank').dispatchEvent(new Event('change', { bubbles: true }))")
+
+                    # Wait for Account list
+                    log("Waiting for account list...")
+                    # Find the account dropdown (not selectBank)
+                    account_dropdown = page.locator("select:not(#selectBank)")
+                    await account_dropdown.wait_for(state="attached", timeout=15000)
+                    # Wait for at least one valid option
+                    await page.wait_for_selector("select:not(#selectBank) option[value]:not([value=''])", state="attached", timeout=10000)
+
+                    if choice.get('account_index') is None:
+                        choice['account_index'] = await page.eval_on_selector(
+                            "select:not(#selectBank)", "s => Array.from(s.options).findIndex(o => o.value)")
+                    await account_dropdown.select_option(index=max(choice['account_index'], 1))
+                    await page.evaluate("document.querySelector('select:not(#selectBank)').dispatchEvent(new Event('change', { bubbles: true }))")
                 log("Account selected.")
             else:
                 log("No banks found.")
-                return
+                return outcomes.result(ipo, outcomes.ERROR, "No banks found")
         except Exception as e:
             log(f"Selection Error: {e}")
-            await page.screenshot(path=f"select_err_{account['username']}.png")
-            return
+            artifacts.capture(page, account, ipo, "account_select", e)
+            return outcomes.result(ipo, outcomes.ERROR, f"Selection error: {e}")
 
         # 4. Fill Form
         log("Filling Form...")
         try:
-            await safe_fill(page, "#appliedKitta", "10")
-            await page.keyboard.press("Tab")
-            await safe_fill(page, "#crnNumber", account['crn'])
-            await page.click("#disclaimer", force=True)
-            
-            proceed_btn = page.locator("button:has-text('Proceed')")
-            if await proceed_btn.is_enabled():
-                await proceed_btn.click()
+            with span("form_fill") as fill_span:
+                await safe_fill(page, "#appliedKitta", "10")
+                await page.keyboard.press("Tab")
+                await safe_fill(page, "#crnNumber", account['crn'])
+                await page.click("#disclaimer", force=True)
+
+                proceed_btn = page.locator("button:has-text('Proceed')")
+                proceed_enabled = await proceed_btn.is_enabled()
+                if not proceed_enabled:
+                    fill_span.fail()
+            if not proceed_enabled:
+                log("Proceed button disabled. Check details.")
+                return outcomes.result(ipo, outcomes.ERROR, "Proceed button disabled")
+
+            with span("submit"):
+                if not await safe_click(page, "button:has-text('Proceed')"):
+                    raise RuntimeError("Proceed button not clickable")
                 await page.wait_for_selector("#transactionPIN", state="visible", timeout=10000)
                 await page.fill("#transactionPIN", account['pin'])
+                channel.expect(ipo)
+                await throttle.scheduler().acquire()
+                # Not retried: a second click could submit the application twice
                 await page.click("button:has-text('Apply')")
-                log("Application submitted. Waiting for confirmation...")
-                await asyncio.sleep(8)
+            log("Application submitted. Waiting for confirmation...")
+            with span("confirmation") as confirm_span:
+                res = await channel.wait()
+                if res['outcome'] not in (outcomes.SUCCESS, outcomes.ALREADY_APPLIED):
+                    confirm_span.fail()
+            if res['outcome'] == outcomes.TIMEOUT:
+                log("No confirmation toast before timeout.")
             else:
-                log("Proceed button disabled. Check details.")
+                log(f"RESPONSE: {res['message']}")
+            await record_outcome(account, ipo, res)
+            return res
         except Exception as e:
             log(f"Form Error: {e}")
-            await page.screenshot(path=f"form_err_{account['username']}.png")
+            artifacts.capture(page, account, ipo, "form", e)
+            return outcomes.result(ipo, outcomes.ERROR, f"Form error: {e}")
 
     except Exception as e:
         log(f"Global App Error: {e}")
-        await page.screenshot(path=f"global_err_{account['username']}.png")
+        artifacts.capture(page, account, ipo, "apply", e)
+        return outcomes.result(ipo, outcomes.ERROR, f"Error: {e}")
@@ -0,0 +1,95 @@
+import asyncio
+import gzip
+import os
+import re
+import time
+import config_and_utils
+from config_and_utils import log
+
+# Diagnostics for failed application steps: a JPEG screenshot and a gzipped
+# DOM snapshot, keyed by account, IPO, stage and time. Captures run in the
+# background; a worker waits for them only before it navigates the page
+# again. The same failure seen on many accounts is captured once, and every
+# run has a cap. A capture is dropped instead of queued while too many are
+# already in flight. Files go to artifacts/ locally, or to the run's
+# key-value store on Apify.
+
+ARTIFACT_DIR = "artifacts"
+SCREENSHOT_QUALITY = 50
+# Captures in flight at once; more are dropped rather than left to pile up on a struggling browser
+MAX_IN_FLIGHT = 4
+
+STATS = {"captured": 0, "duplicates": 0, "dropped": 0, "failed": 0}
+
+_seen = set()
+_tasks = {}  # task -> page
+
+def reset():
+    for key in STATS:
+        STATS[key] = 0
+    _seen.clear()
+    _tasks.clear()
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(text or "none")).strip("_")[:40]
+
+def _signature(stage, error):
+    # "Timeout 15000ms exceeded" on fifty accounts is one problem, not fifty
+    return stage, re.sub(r"\d+", "#", str(error or ""))[:200]
+
+def capture(page, account, ipo, stage, error=None):
+    """Capture `page` for a failed `stage` in the background; returns immediately.
+
+    Await `settle(page)` before navigating the page again.
+    """
+    pair = (account['username'], ipo['company'] if ipo else None, stage)
+    signature = _signature(stage, error)
+    if pair in _seen or signature in _seen:
+        STATS["duplicates"] += 1
+        return
+    if STATS["captured"] >= config_and_utils.ARTIFACT_LIMIT or len(_tasks) >= MAX_IN_FLIGHT:
+        STATS["dropped"] += 1
+        return
+    _seen.update((pair, signature))
+    STATS["captured"] += 1
+    key = "-".join(["ERR", time.strftime("%Y%m%d-%H%M%S"), _slug(account['username']),
+                    _slug(ipo['company'] if ipo else None), _slug(stage)])
+    task = asyncio.get_running_loop().create_task(_capture(page, key))
+    _tasks[task] = page
+    task.add_done_callback(lambda t: _tasks.pop(t, None))
+
+async def _capture(page, key):
+    try:
+        screenshot = await page.screenshot(type="jpeg", quality=SCREENSHOT_QUALITY, timeout=5000)
+        dom = gzip.compress((await page.content()).encode("utf-8"))
+        await _store(f"{key}.jpg", screenshot, "image/jpeg")
+        await _store(f"{key}.html.gz", dom, "application/gzip")
+        log(f"Saved error artifacts {key}.")
+    except Exception as e:
+        STATS["failed"] += 1
+        log(f"Could not capture error artifacts {key}: {e}", level="DEBUG")
+
+async def _store(name, data, content_type):
+    if os.environ.get("APIFY_RUNNING") == "true":
+        from apify import Actor
+        await Actor.set_value(name, data, content_type=content_type)
+        return
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    with open(os.path.join(ARTIFACT_DIR, name), "wb") as f:
+        f.write(data)
+
+async def settle(page, timeout=5):
+    """Wait (briefly) for captures of `page`, before it is closed or handed to another account."""
+    pending = [task for task, p in _tasks.items() if p is page]
+    if pending:
+        await asyncio.wait(pending, timeout=timeout)
+
+async def drain(timeout=30):
+    """Wait for every capture still in flight (end of run)."""
+    if _tasks:
+        await asyncio.wait(list(_tasks), timeout=timeout)
+
+def summary():
+    s = STATS
+    return (f"Error artifacts: {s['captured']} captured, {s['duplicates']} duplicates skipped, "
+            f"{s['dropped']} dropped, {s['failed']} failed.")
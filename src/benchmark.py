@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Throughput benchmark against the local stand-in server (mock_meroshare.py).
+# Runs bot_engine.main and manual_check.run_check for synthetic account lists
+# and reports accounts per minute, peak RSS and per-stage latency.
+
+RESULTS_FILE = "benchmark_results.json"
+
+def synthetic_accounts(n):
+    return [{
+        "name": f"Bench {i}",
+        "username": f"bench{i}",
+        "password": "bench",
+        "crn": f"CRN{i:05d}",
+        "pin": "1234",
+        "dp_id": "13700",
+        "bank_name": "Bench Bank",
+        "active": True,
+    } for i in range(n)]
+
+class RssSampler(threading.Thread):
+    def __init__(self, interval=0.25):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_kb = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        from memory import tree_rss_kb
+        while not self.stopped.is_set():
+            if os.path.isdir("/proc"):
+                self.peak_kb = max(self.peak_kb, tree_rss_kb(os.getpid()))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        # Fallback where /proc is unavailable: largest of this process and any finished child
+        from memory import peak_rss_kb
+        self.peak_kb = max(self.peak_kb, peak_rss_kb())
+
+async def run_case(target, n, state, concurrency, mode):
+    import config_and_utils
+    import history_tracker
+    import perf_report
+
+    accounts = synthetic_accounts(n)
+    config_and_utils.set_accounts(accounts)
+    history_tracker._store = None  # fresh history per case
+    if os.path.exists(config_and_utils.COMPLETED_FILE):
+        os.remove(config_and_utils.COMPLETED_FILE)
+    state.applied.clear()
+    requests_before = state.requests
+
+    sampler = RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    if target == "check":
+        import manual_check
+        perf_report.start_run()
+        await manual_check.run_check(headless=True)
+    else:
+        import bot_engine
+        await bot_engine.main(headless=True, max_concurrency=concurrency, mode=mode)
+    wall = time.perf_counter() - start
+    sampler.stop()
+
+    report = perf_report.build_report()
+    processed = n if target == "run" else 1
+    return {
+        "target": target,
+        "mode": mode if target == "run" else "browser",
+        "accounts": n,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 2),
+        "accounts_per_minute": round(processed / (wall / 60), 1) if wall else None,
+        "peak_rss_mb": round(sampler.peak_kb / 1024, 1),
+        "applications": len(state.applied),
+        "server_requests": state.requests - requests_before,
+        "stages": {k: {"p50": v["p50"], "p95": v["p95"], "failures": v["failures"]} for k, v in report["stages"].items()},
+    }
+
+def print_table(results):
+    print(f"\n{'Target':<6} | {'Mode':<7} | {'Accounts':>8} | {'Conc':>4} | {'Wall s':>8} | {'Acc/min':>8} | {'Peak MB':>8} | {'Applied':>7}")
+    print("-" * 80)
+    for r in results:
+        print(f"{r['target']:<6} | {r['mode']:<7} | {r['accounts']:>8} | {r['concurrency']:>4} | {r['wall_seconds']:>8} | "
+              f"{r['accounts_per_minute']:>8} | {r['peak_rss_mb']:>8} | {r['applications']:>7}")
+        for stage, st in r["stages"].items():
+            print(f"{'':>10} {stage:<15} p50={st['p50']}s p95={st['p95']}s failures={st['failures']}")
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the bot against the local Meroshare stand-in")
+    parser.add_argument("--sizes", default="1,50,500", help="Comma-separated account counts")
+    parser.add_argument("--targets", default="run,check", help="run (bot_engine.main) and/or check (manual_check.run_check)")
+    parser.add_argument("--mode", choices=["browser", "api"], default="browser")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--issues", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every stand-in request")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    from mock_meroshare import start_server
+    server, state = start_server(issues=args.issues, latency=args.latency, error_rate=args.error_rate)
+    base = f"http://127.0.0.1:{server.server_port}"
+    # Must be set before the bot modules are imported, since they read these at import time
+    os.environ["MEROSHARE_URL"] = base
+    os.environ["MEROSHARE_API_URL"] = base + "/api"
+    os.environ["SESSION_TTL"] = "0"
+    # Every case discovers for itself instead of reusing the previous case's list
+    os.environ["DISCOVERY_TTL"] = "0"
+    os.environ.setdefault("TIMING_PROFILE", "fast")
+    # Measure the bot itself rather than its politeness towards the server
+    os.environ.setdefault("RATE_LIMIT", "0")
+
+    output = os.path.abspath(args.output)
+    results = []
+    # Keep history.csv, automation.log and reports out of the working tree
+    with tempfile.TemporaryDirectory(prefix="ipo-bench-") as workdir:
+        os.chdir(workdir)
+        for target in [t.strip() for t in args.targets.split(",") if t.strip()]:
+            for n in [int(x) for x in args.sizes.split(",") if x.strip()]:
+                print(f"Benchmarking {target} with {n} accounts...")
+                results.append(asyncio.run(run_case(target, n, state, args.concurrency, args.mode)))
+        import config_and_utils
+        config_and_utils.flush_logs()
+
+    server.shutdown()
+    print_table(results)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
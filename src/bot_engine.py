@@ -1,85 +1,373 @@
 import asyncio
 import traceback
-from playwright.async_api import async_playwright
 import config_and_utils
-from config_and_utils import log
-from history_tracker import is_already_completed
+from config_and_utils import log, set_log_account, set_log_context, flush_account_state, flush_account_state_periodically
+from history_tracker import is_already_completed, pending_accounts, load_history, flush_history, save_history
 from ipo_discovery import discover_available_ipos
-from application_logic import login, apply_process, setup_toast_monitor
+import session_cache
+import discovery_cache
+import request_filter
+import har_replay
+import checkpoint
+import artifacts
+import memory
+import metrics
+import throttle
+import waits
+import perf_report
+from perf_report import span
+from sharding import select_shard
+from application_logic import login_with_cache, apply_process
+import outcomes
+
+async def open_context(browser, name=None):
+    """New isolated context with the request filter installed (and HAR recording/replay when enabled)."""
+    context = await har_replay.new_context(browser, name)
+    await request_filter.install_request_filter(context)
+    await har_replay.install_replay(context)
+    throttle.watch_responses(context)
+    return context
+
+class ContextPool:
+    """Browser contexts handed from one account to the next instead of being closed and reopened.
+
+    On release the account's cookies and web storage are wiped and its page is
+    closed; routes (request filter) stay installed on the context.
+    """
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+
+    async def acquire(self, name=None):
+        # A HAR recording belongs to one account, so recording never shares contexts
+        if self.idle and not har_replay.recording():
+            context = self.idle.pop()
+            self.reused += 1
+        else:
+            context = await open_context(self.browser, name)
+            self.created += 1
+        return context, await context.new_page()
+
+    async def release(self, context):
+        # Error captures of the outgoing account must finish before its page goes away
+        for page in context.pages:
+            await artifacts.settle(page)
+        if memory.watcher().under_pressure():
+            # Short on memory: give the context back to Chromium instead of keeping it around
+            await context.close()
+            return
+        if har_replay.recording():
+            # Never reused while recording; closing it writes its HAR file now
+            await context.close()
+            return
+        try:
+            for page in context.pages:
+                # sessionStorage dies with the page, localStorage would outlive it
+                await page.evaluate("() => { try { localStorage.clear(); sessionStorage.clear(); } catch (e) {} }")
+                await page.close()
+            await context.clear_cookies()
+            self.idle.append(context)
+        except Exception:
+            await context.close()
+
+    async def close(self):
+        for context in self.idle:
+            await context.close()
+        self.idle = []
+
+    def summary(self):
+        return f"Browser contexts: {self.created} created, {self.reused} reused."
+
+class LoginPipeline:
+    """Logs accounts in ahead of their turn to apply.
+
+    Up to `concurrency + prefetch` accounts hold a logged-in context at once,
+    but only `concurrency` of them fill and submit forms; the others are
+    logging in meanwhile, so login latency is hidden behind applications.
+    """
+
+    def __init__(self, browser, concurrency=1, prefetch=0):
+        self.pool = ContextPool(browser)
+        # Lowered by the memory watcher when the browser grows too close to the memory limit
+        self.sessions = memory.AdaptiveLimit(concurrency + prefetch)
+        memory.watcher().adapt(self.sessions)
+        metrics.watch_pipeline(self)
+        self.applying = asyncio.Semaphore(concurrency)
+
+async def login_account(pool, acc):
+    """A logged-in (context, page) for `acc`; otherwise False if the login was rejected, None if it errored.
+
+    On failure the context goes back to the pool.
+    """
+    set_log_context(stage="login")
+    context, page = await pool.acquire(acc['username'])
+    logged_in = None
+    try:
+        logged_in = await login_with_cache(page, acc)
+        if logged_in:
+            return context, page
+        log(f"Login failed for {acc['name']}. Skipping.")
+    except Exception:
+        log(f"Login error for {acc['name']}: {traceback.format_exc()}", level="ERROR")
+    await pool.release(context)
+    return logged_in
+
+async def process_account(pipeline, acc, available_ipos, session=None):
+    """Log in one account and apply for every pending IPO.
+
+    `session` may be an already logged-in (context, page) pair (the discovery
+    session), in which case the login step is skipped. Returns one result per IPO tried.
+    """
+    set_log_account(acc['name'])
+    results = []
+
+    # Check history (and a resumed run's checkpoint) for each available IPO for this account
+    to_do = [ipo for ipo in available_ipos if not is_already_completed(acc['username'], ipo['company'])
+             and not checkpoint.settled(acc['username'], ipo['company'])]
+
+    if not to_do:
+        log(f"All available IPOs already applied for {acc['name']}. Skipping.")
+        if session:
+            await pipeline.pool.release(session[0])
+        return results
+
+    log(f"Processing {len(to_do)} IPOs for {acc['name']}...")
+
+    async with pipeline.sessions:
+        if session is None:
+            session = await login_account(pipeline.pool, acc)
+            if not session:
+                # Server trouble rather than bad credentials goes to the requeue
+                outcome = outcomes.ERROR if session is None else outcomes.LOGIN_REJECTED
+                results = [outcomes.result(ipo, outcome, "Login failed") for ipo in to_do]
+                checkpoint.record_all(acc['username'], results)
+                return results
+        context, page = session
+        try:
+            async with pipeline.applying:
+                for ipo in to_do:
+                    set_log_context(ipo=ipo['company'], stage="apply")
+                    # Perform application (bounded by the timing profile's hard deadline)
+                    res = await waits.with_deadline(apply_process(page, acc, ipo))
+                    if res is None:
+                        artifacts.capture(page, acc, ipo, "deadline")
+                        res = outcomes.result(ipo, outcomes.TIMEOUT)
+                    results.append(res)
+                    checkpoint.record(acc['username'], res)
+                    if res['outcome'] == outcomes.WRONG_PIN:
+                        log(f"Skipping remaining IPOs for {acc['name']} until the PIN is fixed.")
+                        break
+        except Exception:
+            log(f"Worker error for {acc['name']}: {traceback.format_exc()}", level="ERROR")
+            tried = {r['company'] for r in results}
+            failed = [outcomes.result(ipo, outcomes.ERROR, "Worker error") for ipo in to_do if ipo['company'] not in tried]
+            checkpoint.record_all(acc['username'], failed)
+            results += failed
+        finally:
+            await pipeline.pool.release(context)
+    return results
 
 # Refactor: main function moved to module level for importability
-async def main(headless=False):
+async def main(headless=False, max_concurrency=1, mode="browser", available_ipos=None, shard_index=0, shard_count=1,
+               watch=False, watch_interval=None, watch_duration=None):
+    """Run one pass over the active accounts.
+
+    `available_ipos` skips discovery (a sharding coordinator hands it over), and
+    `shard_index`/`shard_count` restrict the run to this shard's accounts.
+    With `watch`, keep polling for new issues instead (see watch.py).
+    """
+    perf_report.start_run()
+    # Shards pace themselves, so each takes its share of the overall rate
+    throttle.reset(shard_count)
+    checkpoint.reset()
+    artifacts.reset()
+    memory.start()
+    await metrics.start()
+    har_replay.prepare()
+    # Shards leave the history store to their coordinator
+    await load_history(write_back=shard_count <= 1)
+    interval = config_and_utils.ACCOUNT_FLUSH_INTERVAL
+    flusher = asyncio.create_task(flush_account_state_periodically(interval)) if interval > 0 else None
+    active_accounts = config_and_utils.active_accounts()
+    if shard_count > 1:
+        active_accounts = select_shard(active_accounts, shard_index, shard_count)
+        log(f"Shard {shard_index + 1}/{shard_count}: {len(active_accounts)} accounts.")
+    try:
+        if watch:
+            from watch import watch as run_watch
+            return await run_watch(active_accounts, headless=headless, max_concurrency=max_concurrency, mode=mode,
+                                   interval=watch_interval, duration=watch_duration)
+        # A resumed run keeps the IPO list it was working through
+        resumed_ipos = await checkpoint.begin(shard_index, shard_count)
+        if available_ipos is None:
+            available_ipos = resumed_ipos or await discovery_cache.load_ipos()
+        if available_ipos:
+            # With the IPO list known up front, finished accounts never get a login (or a browser)
+            pending = [acc for acc in pending_accounts(active_accounts, available_ipos)
+                       if not all(checkpoint.settled(acc['username'], ipo['company']) for ipo in available_ipos)]
+            if len(pending) < len(active_accounts):
+                log(f"{len(active_accounts) - len(pending)} accounts have nothing left to apply for. Skipping them.")
+            if not pending:
+                log("Nothing left to apply for.")
+                await checkpoint.finish()
+                return
+            active_accounts = pending
+        if mode == "api":
+            if config_and_utils.HAR_MODE:
+                log("HAR record/replay only covers browser mode; API mode uses the network as usual.", level="WARNING")
+            from api_engine import main as run_api
+            await run_api(max_concurrency=max_concurrency, accounts=active_accounts, available_ipos=available_ipos)
+        else:
+            await run_browser(headless=headless, max_concurrency=max_concurrency, accounts=active_accounts, available_ipos=available_ipos)
+        # Only a run that got to the end clears its checkpoint; a crash or abort leaves it to resume from
+        await checkpoint.finish()
+    finally:
+        if flusher:
+            flusher.cancel()
+        flush_account_state()
+        await flush_history()
+        await save_history()
+        # Still set if the run did not complete: make sure its last steps are on disk
+        await checkpoint.save()
+        await artifacts.drain()
+        memory.stop()
+        await metrics.stop()
+        extra = {
+            "session_cache": dict(session_cache.STATS),
+            "request_filter": dict(request_filter.STATS),
+            "throttle": throttle.scheduler().report(),
+            "memory": memory.watcher().report(),
+            "artifacts": dict(artifacts.STATS),
+        }
+        replay_diff = har_replay.write_diff()
+        if replay_diff is not None:
+            extra["har_replay"] = replay_diff
+        await perf_report.write_report(extra=extra)
+
+async def discover_with(page, acc):
+    """Log in `acc` on `page` and return the open IPOs ([] on failure)."""
+    log(f"Using {acc['name']} to check for available IPOs...")
+    if not await login_with_cache(page, acc):
+        log("Initial login failed. Cannot proceed to discovery.")
+        return []
+    with span("discovery", account=acc['name']) as discovery_span:
+        available_ipos = await discover_available_ipos(page)
+        if not available_ipos:
+            discovery_span.fail()
+    await discovery_cache.save_ipos(available_ipos)
+    return available_ipos
+
+async def discover_only(headless=False, mode="browser"):
+    """Discovery on its own, for a coordinator that hands the IPO list to shards."""
+    active_accounts = config_and_utils.active_accounts()
+    if not active_accounts:
+        log("No active accounts found in accounts.csv")
+        return []
+    cached = await discovery_cache.load_ipos()
+    if cached is not None:
+        return cached
+    if mode == "api":
+        from api_engine import discover_only as discover_api
+        return await discover_api(active_accounts[0])
+    from playwright.async_api import async_playwright
+    async with async_playwright() as p:
+        browser = await memory.launch_browser(p, headless)
+        context = await open_context(browser, active_accounts[0]['username'])
+        available_ipos = await discover_with(await context.new_page(), active_accounts[0])
+        await context.close()
+        await browser.close()
+        # The shards apply with their own sessions, so none of them keeps the discovering account's state
+        return discovery_cache.shared_ipos(available_ipos)
+
+async def apply_all(browser, accounts, available_ipos, max_concurrency=1, context=None, page=None):
+    """Run process_account for every account on an already launched browser.
+
+    `context`/`page`, if given, is a logged-in session for the first account.
+    Returns the number of IPOs handled.
+    """
+    concurrency = max(1, int(max_concurrency or 1))
+    prefetch = max(0, config_and_utils.LOGIN_PREFETCH)
+    pipeline = LoginPipeline(browser, concurrency, prefetch)
+    if prefetch:
+        log(f"Logging in up to {prefetch} accounts ahead.")
+
+    session = (context, page) if context else None
+    # Apply/edit state is that of the account that ran discovery, so only its session keeps it
+    own_ipos = {ipo['company']: ipo for ipo in available_ipos}
+    available_ipos = discovery_cache.shared_ipos(available_ipos)
+    checkpoint.plan(accounts, available_ipos)
+
+    async def run_one(acc, ipos, attempt):
+        # The discovery session belongs to the first pass; retries log in again
+        if session and attempt == 0 and acc is accounts[0]:
+            return await process_account(pipeline, acc, [own_ipos[ipo['company']] for ipo in ipos], session)
+        return await process_account(pipeline, acc, ipos)
+
+    try:
+        # Failed (account, IPO) pairs are retried once the first pass is done
+        results = await throttle.run_with_requeue(accounts, available_ipos, run_one)
+    finally:
+        memory.watcher().release(pipeline.sessions)
+        await pipeline.pool.close()
+    log(pipeline.pool.summary())
+    return sum(len(r) for r in results)
+
+async def run_browser(headless=False, max_concurrency=1, accounts=None, available_ipos=None):
     log("=== Meroshare Bot Started (Modular) ===")
+    log(f"Timing profile: {config_and_utils.TIMING_PROFILE}")
     if headless:
         log("Running in HEADLESS mode.")
-    
+    if memory.low_memory():
+        log("Low-memory mode: lean Chromium flags and context template.")
+
     # Filter active accounts
-    active_accounts = [a for a in config_and_utils.ACCOUNTS if a.get("active", True)]
+    if accounts is None:
+        accounts = config_and_utils.active_accounts()
+    active_accounts = accounts
     if not active_accounts:
         log("No active accounts found in accounts.csv")
         return
 
+    max_concurrency = max(1, int(max_concurrency or 1))
+    if max_concurrency > 1:
+        log(f"Running up to {max_concurrency} accounts in parallel.")
+
+    from playwright.async_api import async_playwright
     async with async_playwright() as p:
         # Launch browser
-        browser = await p.chromium.launch(headless=headless, slow_mo=800)
-        context = await browser.new_context()
-        page = await context.new_page()
-
-        # 1. Use the first account to discover available IPOs
-        log(f"Using {active_accounts[0]['name']} to check for available IPOs...")
-        if not await login(page, active_accounts[0]):
-            log("Initial login failed. Cannot proceed to discovery.")
-            await browser.close()
-            return
+        browser = await memory.launch_browser(p, headless)
+        context = page = None
+
+        # 1. Use the first account to discover available IPOs (unless handed a list)
+        if available_ipos is None:
+            context = await open_context(browser, active_accounts[0]['username'])
+            page = await context.new_page()
+            available_ipos = await discover_with(page, active_accounts[0])
 
-        available_ipos = await discover_available_ipos(page)
-        
         if not available_ipos:
             log("No available IPOs found or error during discovery.")
+            if context:
+                await context.close()
             await browser.close()
             return
 
-        # 2. Iterate through all active accounts and apply if not already completed
-        for acc in active_accounts:
-            # Check history for each available IPO for this account
-            to_do = [ipo for ipo in available_ipos if not is_already_completed(acc['username'], ipo['company'])]
-            
-            if not to_do:
-                log(f"All available IPOs already applied for {acc['name']}. Skipping.")
-                continue
-
-            log(f"Processing {len(to_do)} IPOs for {acc['name']}...")
-
-            # If it's not the first account, we need to login again
-            if acc != active_accounts[0]:
-                await context.close()
-                context = await browser.new_context()
-                page = await context.new_page()
-                if not await login(page, acc):
-                    log(f"Login failed for {acc['name']}. Skipping.")
-                    continue
-
-            for ipo in to_do:
-                # Setup monitoring for success messages
-                await setup_toast_monitor(page, acc, ipo['company'], "", ipo['url'])
-                
-                # Perform application
-                await apply_process(page, acc, ipo)
-                await asyncio.sleep(2)
+        # 2. Apply for every active account, at most `max_concurrency` contexts at a time.
+        # A discovery session is already logged in, so the first account reuses it.
+        applied = await apply_all(browser, active_accounts, available_ipos, max_concurrency, context, page)
+        log(f"Processed {applied} applications across {len(active_accounts)} accounts.")
+        log(session_cache.summary())
+        log(request_filter.summary())
+        log(throttle.scheduler().summary())
+        log(memory.summary())
+        log(artifacts.summary())
 
         await browser.close()
         log("=== Meroshare Bot Finished ===")
 
 if __name__ == "__main__":
-    import argparse
     import sys
-    
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--headless", action="store_true", help="Run browser in headless mode")
-    args = parser.parse_args()
-    
-    try:
-        asyncio.run(main(headless=args.headless))
-    except Exception:
-        log(f"CRASH: {traceback.format_exc()}")
-        sys.exit(1) # Exit with error code on crash
+    from cli import main as cli_main
+    sys.exit(cli_main(["run"] + sys.argv[1:]))
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import time
+import config_and_utils
+from config_and_utils import log
+import kv_storage
+import outcomes
+import perf_report
+
+# Run state checkpointed at every (account, IPO) step, so a run that is
+# migrated, aborted or crashes halfway can be picked up where it stopped: the
+# discovered IPOs and the status of every pair. Saves are coalesced (at most
+# one write in flight, always of the latest state). The report spans so far
+# are added on full saves: at the end of a run and, on Apify, on the
+# platform's persist-state, migrating and aborting events. A run that
+# completes clears its checkpoint.
+
+STATE_FILE = os.environ.get("RUN_STATE_FILE", "run_state.json")
+STATE_STORE_NAME = "meroshare-run-state"
+STATE_KEY = "RUN_STATE"
+
+DONE = "done"
+FAILED = "failed"
+RETRYING = "retrying"
+PENDING = "pending"
+# Anything else (wrong PIN, rejected login) is final for this run
+STATUS = {outcomes.SUCCESS: DONE, outcomes.ALREADY_APPLIED: DONE, outcomes.ERROR: RETRYING, outcomes.TIMEOUT: RETRYING}
+
+_state = None
+_key = STATE_KEY
+_dirty = False
+_writer = None
+_listening = False
+
+async def _read():
+    return await kv_storage.read(STATE_FILE, STATE_STORE_NAME, _key)
+
+async def _write(entry):
+    await kv_storage.write(STATE_FILE, STATE_STORE_NAME, _key, entry)
+
+def reset():
+    global _state, _dirty, _writer
+    _state, _dirty, _writer = None, False, None
+
+async def begin(shard_index=0, shard_count=1):
+    """Start checkpointing this run; resumes a recent unfinished checkpoint if there is one.
+
+    Returns the resumed run's IPO list, or None for a fresh run.
+    """
+    global _state, _key
+    _key = f"{STATE_KEY}-{shard_index}" if shard_count > 1 else STATE_KEY
+    _listen()
+    entry = None
+    try:
+        entry = await _read()
+    except Exception as e:
+        log(f"Checkpoint read error: {e}")
+    age = time.time() - (entry or {}).get("saved_at", 0)
+    if entry and entry.get("ipos") and age <= config_and_utils.RESUME_TTL:
+        _state = entry
+        perf_report.SPANS[:0] = entry.get("spans", [])
+        # Time between the crash and now is downtime, not part of the run
+        perf_report.RUN["earlier"] = entry.get("elapsed", 0.0)
+        log(f"Resuming run from a checkpoint saved {int(age)}s ago: {summary()}.")
+        return entry["ipos"]
+    _state = {"ipos": None, "pairs": {}}
+    return None
+
+def plan(accounts, ipos):
+    """Record the IPO list and every (account, IPO) pair still to be tried."""
+    if _state is None:
+        return
+    if _state["ipos"] is None:
+        _state["ipos"] = ipos
+    for acc in accounts:
+        pairs = _state["pairs"].setdefault(acc['username'], {})
+        for ipo in ipos:
+            pairs.setdefault(ipo['company'], PENDING)
+    _schedule()
+
+def record(username, res):
+    """Step boundary: store the outcome of one (account, IPO) pair."""
+    if _state is None:
+        return
+    _state["pairs"].setdefault(username, {})[res['company']] = STATUS.get(res['outcome'], FAILED)
+    _schedule()
+
+def record_all(username, results):
+    for res in results:
+        record(username, res)
+
+def settled(username, company):
+    """True if this run already finished the pair, successfully or for good."""
+    if _state is None:
+        return False
+    return _state["pairs"].get(username, {}).get(company) in (DONE, FAILED)
+
+def summary():
+    counts = {DONE: 0, FAILED: 0, RETRYING: 0, PENDING: 0}
+    for pairs in (_state or {}).get("pairs", {}).values():
+        for status in pairs.values():
+            counts[status] = counts.get(status, 0) + 1
+    return ", ".join(f"{n} {status}" for status, n in counts.items())
+
+def _snapshot(spans=False):
+    snapshot = {**_state, "saved_at": time.time(), "elapsed": perf_report.elapsed()}
+    if spans:
+        # The report spans grow with every step, so only full saves carry them
+        snapshot["spans"] = list(perf_report.SPANS)
+    return snapshot
+
+def _schedule():
+    global _dirty, _writer
+    _dirty = True
+    if _writer is None or _writer.done():
+        _writer = asyncio.get_running_loop().create_task(_drain())
+
+async def _drain():
+    global _dirty
+    while _dirty and _state is not None:
+        _dirty = False
+        try:
+            await _write(_snapshot())
+        except Exception as e:
+            log(f"Checkpoint write error: {e}")
+
+async def save():
+    """Write the current state and report spans now (and wait for any write in flight)."""
+    if _writer is not None and not _writer.done():
+        await _writer
+    if _state is not None:
+        try:
+            await _write(_snapshot(spans=True))
+        except Exception as e:
+            log(f"Checkpoint write error: {e}")
+
+async def finish():
+    """The run completed: drop the checkpoint so the next run starts fresh."""
+    global _state
+    if _state is None:
+        return
+    if _writer is not None and not _writer.done():
+        await _writer
+    _state = None
+    try:
+        await _write(None)
+    except Exception as e:
+        log(f"Checkpoint clear error: {e}")
+
+def _listen():
+    global _listening
+    if _listening or os.environ.get("APIFY_RUNNING") != "true":
+        return
+    from apify import Actor, Event
+    from history_tracker import flush_history, save_history
+
+    async def persist(event_data=None):
+        # The process may be stopped right after these events, so write out everything pending
+        await flush_history()
+        await save_history()
+        await save()
+
+    for event in (Event.PERSIST_STATE, Event.MIGRATING, Event.ABORTING):
+        Actor.on(event, persist)
+    _listening = True
@@ -0,0 +1,166 @@
+import argparse
+import os
+import sys
+
+# Single command-line entry point. Subcommands import what they need only when
+# they run, so read-only commands (history, convert-input) never load
+# Playwright, httpx or apify.
+#
+#   python src/cli.py run [--headless] [--concurrency N] [--mode api] ...
+#   python src/cli.py check [--refresh]
+#   python src/cli.py history [--user U] [--company C] [--since D] [--until D] [--export PATH]
+#   python src/cli.py migrate
+#   python src/cli.py convert-input [--csv accounts.csv] [--output apify_input.json]
+
+def cmd_run(args):
+    import asyncio
+    import json
+    import config_and_utils
+
+    config_and_utils.load_config(accounts_file=args.accounts)
+    if args.timing:
+        config_and_utils.TIMING_PROFILE = args.timing
+    if args.prefetch is not None:
+        config_and_utils.LOGIN_PREFETCH = args.prefetch
+    if args.refresh_discovery:
+        config_and_utils.FORCE_DISCOVERY = True
+    if args.low_memory:
+        config_and_utils.LOW_MEMORY = True
+    if args.memory_limit is not None:
+        config_and_utils.MEMORY_LIMIT_MB = args.memory_limit
+    if args.metrics_port is not None:
+        config_and_utils.METRICS_PORT = args.metrics_port
+    if args.har:
+        config_and_utils.HAR_MODE = args.har
+    if args.har_dir:
+        config_and_utils.HAR_DIR = args.har_dir
+
+    if args.shards > 1:
+        from sharding import run_local
+        return asyncio.run(run_local(args.shards, headless=args.headless, max_concurrency=args.concurrency, mode=args.mode))
+
+    from bot_engine import main as run_bot
+    available_ipos = None
+    if args.ipos_file:
+        with open(args.ipos_file, "r", encoding="utf-8") as f:
+            available_ipos = json.load(f)
+    asyncio.run(run_bot(headless=args.headless, max_concurrency=args.concurrency, mode=args.mode,
+                        available_ipos=available_ipos, shard_index=args.shard_index, shard_count=args.shard_count,
+                        watch=args.watch, watch_interval=args.interval, watch_duration=args.duration))
+
+def cmd_check(args):
+    import asyncio
+    import config_and_utils
+
+    config_and_utils.load_config(accounts_file=args.accounts)
+    if args.refresh:
+        config_and_utils.FORCE_DISCOVERY = True
+    from manual_check import run_check
+    asyncio.run(run_check(headless=args.headless))
+
+def cmd_history(args):
+    from history_tracker import get_store, get_applied_list, migrate_json_history
+
+    # Auto-migrate on run
+    migrate_json_history()
+
+    if args.export:
+        get_store().export_csv(args.export)
+        print(f"Exported history to {args.export}.")
+
+    history = get_applied_list(args.user, args.company, args.since, args.until)
+    if not history:
+        print("No application history found.")
+    else:
+        print(f"{'Username':<15} | {'Company':<30} | {'Date':<20}")
+        print("-" * 70)
+        for entry in history:
+            print(f"{entry.get('Username', 'N/A'):<15} | {entry.get('Company', 'N/A'):<30} | {entry.get('Applied At', 'N/A'):<20}")
+
+def cmd_migrate(args):
+    from history_tracker import migrate_json_history
+    migrate_json_history()
+
+def cmd_convert_input(args):
+    import json
+    from config_and_utils import load_accounts, account_to_input
+
+    if not os.path.exists(args.csv):
+        print(f"Error: {args.csv} not found.")
+        return 1
+    input_data = {"accounts": [account_to_input(acc) for acc in load_accounts(args.csv)]}
+
+    # 1. Full Input File (Object)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(input_data, f, indent=4)
+
+    # 2. Array Only File (For pasting into "Accounts" field directly)
+    array_file = os.path.splitext(args.output)[0] + "_array.json"
+    with open(array_file, 'w', encoding='utf-8') as f:
+        json.dump(input_data["accounts"], f, indent=4)
+
+    print(f"Successfully created {args.output} and {array_file} with {len(input_data['accounts'])} accounts.")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Meroshare IPO bot")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Apply for open IPOs")
+    run.add_argument("--accounts", help="Accounts CSV (default: accounts.csv)")
+    run.add_argument("--headless", action="store_true", help="Run browser in headless mode")
+    run.add_argument("--concurrency", type=int, default=1, help="Number of accounts to process in parallel")
+    run.add_argument("--mode", choices=["browser", "api"], default="browser", help="Drive the Meroshare site with a browser or call its API directly")
+    run.add_argument("--prefetch", type=int, help="Accounts to log in ahead of those applying (browser mode, default 1)")
+    run.add_argument("--low-memory", action="store_true", help="Lean Chromium flags and contexts for small machines")
+    run.add_argument("--memory-limit", type=int, help="Lower concurrency to keep the bot and its browser under this many MB")
+    run.add_argument("--timing", choices=["fast", "safe"], help="Timing profile for waits and timeouts")
+    run.add_argument("--refresh-discovery", action="store_true", help="Ignore the cached IPO list and discover again")
+    run.add_argument("--watch", action="store_true", help="Keep running and apply as soon as a new issue opens")
+    run.add_argument("--interval", type=int, help="Seconds between issue-list polls in watch mode")
+    run.add_argument("--duration", type=int, help="Stop watching after this many seconds (0 = until stopped)")
+    run.add_argument("--metrics-port", type=int, help="Serve live metrics in Prometheus format on this port")
+    run.add_argument("--har", choices=["record", "replay"], help="Record browser traffic to HAR files, or replay a run from them offline")
+    run.add_argument("--har-dir", help="Directory for HAR files (default: har)")
+    run.add_argument("--shards", type=int, default=1, help="Split accounts across this many worker processes")
+    run.add_argument("--shard-index", type=int, default=0, help=argparse.SUPPRESS)
+    run.add_argument("--shard-count", type=int, default=1, help=argparse.SUPPRESS)
+    run.add_argument("--ipos-file", help=argparse.SUPPRESS)
+    run.set_defaults(func=cmd_run, crash_log=True)
+
+    check = sub.add_parser("check", help="List open IPOs without applying")
+    check.add_argument("--accounts", help="Accounts CSV (default: accounts.csv)")
+    check.add_argument("--headless", action="store_true", help="Run browser in headless mode")
+    check.add_argument("--refresh", action="store_true", help="Ignore the cached IPO list and check the site")
+    check.set_defaults(func=cmd_check, crash_log=True)
+
+    history = sub.add_parser("history", help="List application history")
+    history.add_argument("--user", help="Only show this username")
+    history.add_argument("--company", help="Only show this company")
+    history.add_argument("--since", help="Earliest 'Applied At' (YYYY-MM-DD)")
+    history.add_argument("--until", help="Latest 'Applied At' (YYYY-MM-DD)")
+    history.add_argument("--export", help="Write the (SQLite) history out as CSV to this path")
+    history.set_defaults(func=cmd_history, crash_log=False)
+
+    migrate = sub.add_parser("migrate", help="Import legacy completed_applications.json into history")
+    migrate.set_defaults(func=cmd_migrate, crash_log=False)
+
+    convert = sub.add_parser("convert-input", help="Turn accounts.csv into an Apify input JSON")
+    convert.add_argument("--csv", default="accounts.csv", help="Accounts CSV to read")
+    convert.add_argument("--output", default="apify_input.json", help="Input JSON to write (an _array.json copy is written next to it)")
+    convert.set_defaults(func=cmd_convert_input, crash_log=False)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.crash_log:
+        return args.func(args)
+    try:
+        return args.func(args)
+    except Exception:
+        import traceback
+        from config_and_utils import log
+        log(f"CRASH: {traceback.format_exc()}", level="ERROR")
+        return 1 # Exit with error code on crash
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,186 @@
+import atexit
 import csv
+import json
 import time
 import os
+import queue
+import sys
+import tempfile
+import threading
+import contextvars
 
 ACCOUNTS_FILE = "accounts.csv"
-COMPLETED_FILE = "history.csv"
+COMPLETED_FILE = os.environ.get("HISTORY_FILE", "history.csv")
+# Optional SQLite file for indexed history queries; history.csv is still written either way.
+HISTORY_DB = os.environ.get("HISTORY_DB")
+# Apify: saved applications collected before they are pushed to the dataset and the history store in one go
+HISTORY_BATCH = int(os.environ.get("HISTORY_BATCH", "25"))
+# How long (seconds) a saved login session is reused before logging in again. 0 disables the cache.
+SESSION_TTL = int(os.environ.get("SESSION_TTL", "900"))
+# How long (seconds) a discovered IPO list is reused across runs and shards; 0 disables. FORCE_DISCOVERY ignores it once.
+DISCOVERY_TTL = int(os.environ.get("DISCOVERY_TTL", "600"))
+FORCE_DISCOVERY = os.environ.get("FORCE_DISCOVERY", "false").lower() == "true"
+# "fast" or "safe": bounds for the condition-based waits in waits.py
+TIMING_PROFILE = os.environ.get("TIMING_PROFILE", "safe")
+# Request filtering: resource types to abort, and whether to abort hosts outside APP_URL/API_URL/ALLOWED_HOSTS
+BLOCKED_RESOURCE_TYPES = os.environ.get("BLOCKED_RESOURCE_TYPES", "image,font,media")
+BLOCK_THIRD_PARTY = os.environ.get("BLOCK_THIRD_PARTY", "true").lower() == "true"
+ALLOWED_HOSTS = os.environ.get("ALLOWED_HOSTS", "cdsc.com.np")
 
-def log(message):
+# Server pacing (throttle.py): navigations/submissions/API requests per second (0 = unpaced) and burst size,
+# responses slower than SLOW_RESPONSE seconds count against the rate, the breaker pauses everyone for
+# BREAKER_COOLDOWN seconds once BREAKER_ERROR_RATE of recent requests failed, and failed (account, IPO)
+# pairs are retried up to REQUEUE_ATTEMPTS times.
+RATE_LIMIT = float(os.environ.get("RATE_LIMIT", "20"))
+RATE_BURST = int(os.environ.get("RATE_BURST", "20"))
+SLOW_RESPONSE = float(os.environ.get("SLOW_RESPONSE", "5"))
+BREAKER_ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", "30"))
+REQUEUE_ATTEMPTS = int(os.environ.get("REQUEUE_ATTEMPTS", "1"))
+
+# Browser mode: how many accounts log in ahead of those currently applying (0 = log in only when it is their turn)
+LOGIN_PREFETCH = int(os.environ.get("LOGIN_PREFETCH", "1"))
+# Low-memory browser mode (memory.py): lean Chromium flags and context template; MEMORY_LIMIT_MB caps the
+# resident memory of the bot and its browser by lowering concurrency (0 = 85% of the Apify container in low-memory mode).
+LOW_MEMORY = os.environ.get("LOW_MEMORY", "false").lower() == "true"
+MEMORY_LIMIT_MB = int(os.environ.get("MEMORY_LIMIT_MB", "0"))
+# How old (seconds) an unfinished run's checkpoint may be and still be resumed; 0 always starts fresh.
+RESUME_TTL = int(os.environ.get("RESUME_TTL", "21600"))
+# Watch mode: seconds between issue-list polls, and how long to keep watching (0 = until stopped)
+WATCH_INTERVAL = int(os.environ.get("WATCH_INTERVAL", "60"))
+WATCH_DURATION = int(os.environ.get("WATCH_DURATION", "0"))
+
+# HAR capture: "record" saves each browser context's traffic under HAR_DIR, "replay" serves runs from it offline.
+# HAR_TIMING replays each response after its recorded duration instead of instantly.
+HAR_MODE = os.environ.get("HAR_MODE", "").lower()
+HAR_DIR = os.environ.get("HAR_DIR", "har")
+HAR_TIMING = os.environ.get("HAR_TIMING", "true").lower() == "true"
+
+# Live metrics (metrics.py): Prometheus text endpoint on METRICS_HOST:METRICS_PORT (0 = off), and on Apify
+# a status message refreshed every STATUS_INTERVAL seconds (0 = off).
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+STATUS_INTERVAL = int(os.environ.get("STATUS_INTERVAL", "30"))
+
+# Error artifacts (screenshot + DOM snapshot of a failed step) captured per run; 0 disables them.
+ARTIFACT_LIMIT = int(os.environ.get("ARTIFACT_LIMIT", "50"))
+
+# Seconds between write-outs of account status/bank updates to accounts.csv; 0 means once at the end of a run.
+ACCOUNT_FLUSH_INTERVAL = int(os.environ.get("ACCOUNT_FLUSH_INTERVAL", "0"))
+
+# Meroshare web app; overridable for the same reason as API_URL below.
+APP_URL = os.environ.get("MEROSHARE_URL", "https://meroshare.cdsc.com.np").rstrip("/")
+# Backend used by the browserless API engine. Overridable so it can point at a local stand-in server.
+API_URL = os.environ.get("MEROSHARE_API_URL", "https://webbackend.cdsc.com.np/api")
+
+LOG_FILE = "automation.log"
+# Minimum level written out, and "text" or "json" (one object per line with account/ipo/stage fields)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+# Fields (account, ipo, stage) describing what the current asyncio task is
+# working on. Tasks copy the context when created, so parallel accounts each
+# tag their own lines without passing anything to log().
+_log_context = contextvars.ContextVar("log_context", default={})
+
+def set_log_context(**fields):
+    ctx = dict(_log_context.get())
+    ctx.update(fields)
+    _log_context.set(ctx)
+
+def get_log_context():
+    return _log_context.get()
+
+def set_log_account(name):
+    set_log_context(account=name)
+
+class _LogWriter(threading.Thread):
+    """Drains queued log lines to stdout and a buffered log file off the event loop."""
+
+    def __init__(self):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = queue.SimpleQueue()
+        self.file = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            self.write(item)
+            # Flush once the backlog is drained rather than per line
+            if self.queue.empty():
+                self.flush()
+        self.flush()
+
+    def write(self, item):
+        console_line, file_line = item
+        print(console_line)
+        try:
+            if self.file is None:
+                self.file = open(LOG_FILE, "a", encoding='utf-8', buffering=64 * 1024)
+            self.file.write(file_line + "\n")
+        except:
+            pass
+
+    def flush(self):
+        sys.stdout.flush()
+        try:
+            if self.file:
+                self.file.flush()
+        except:
+            pass
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _LogWriter()
+                _writer.start()
+                atexit.register(flush_logs)
+    return _writer
+
+def flush_logs():
+    """Write out everything queued so far and stop the writer thread."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer:
+        writer.queue.put(None)
+        writer.join(timeout=5)
+
+def log(message, level="INFO", **fields):
+    if LEVELS.get(level, 20) < LEVELS.get(LOG_LEVEL, 20):
+        return
     timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    formatted_msg = f"[{timestamp}] {message}"
-    print(formatted_msg)
-    try:
-        with open("automation.log", "a", encoding='utf-8') as f:
-            f.write(formatted_msg + "\n")
-    except:
-        pass
+    ctx = {**_log_context.get(), **fields}
+    account = ctx.get("account")
+    prefix = f"[{account}] " if account else ""
+    if level != "INFO":
+        prefix = f"{level}: " + prefix
+    formatted_msg = f"[{timestamp}] {prefix}{message}"
+    file_line = formatted_msg
+    if LOG_FORMAT == "json":
+        file_line = json.dumps({"ts": timestamp, "level": level, **ctx, "message": str(message)}, ensure_ascii=False, default=str)
+    _get_writer().queue.put((formatted_msg, file_line))
 
-def load_accounts():
+def load_accounts(path=ACCOUNTS_FILE):
+    """Read accounts from the CSV at `path` (columns as in accounts.csv)."""
     accounts = []
-    
-    # 1. Apify Support (Injected by main.py or other means)
-    # ACCOUNTS variable is global, so main.py can override it directly.
-    # However, if we want to load here:
-    # We rely on main.py injecting it into this module's ACCOUNTS variable *after* import.
-    # But since this runs on import, we return empty or CSV data first.
-    
-    if not os.path.exists(ACCOUNTS_FILE):
+    if not os.path.exists(path):
         # Only log warning if not running in Apify, as Apify might use input only
         if os.environ.get("APIFY_RUNNING") != "true":
-            log(f"Warning: {ACCOUNTS_FILE} not found.")
+            log(f"Warning: {path} not found.")
         return []
     
     try:
         # Use utf-8-sig for Excel compatibility with Nepali fonts
-        with open(ACCOUNTS_FILE, mode='r', encoding='utf-8-sig') as f:
+        with open(path, mode='r', encoding='utf-8-sig') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 # Basic validation: requires username
@@ -50,75 +198,190 @@ def load_accounts():
                         "available_banks": row.get("Available Banks", "")
                     })
     except Exception as e:
-        log(f"Error loading {ACCOUNTS_FILE}: {e}")
+        log(f"Error loading {path}: {e}")
     return accounts
 
-ACCOUNTS = load_accounts()
+# Accounts for this run. Nothing is read at import time: entry points call
+# load_config() (or set_accounts()), and engines read them through
+# get_accounts()/active_accounts(), which fall back to accounts.csv on first use.
+ACCOUNTS = None
+
+def set_accounts(accounts):
+    global ACCOUNTS
+    ACCOUNTS = list(accounts)
+
+def get_accounts():
+    if ACCOUNTS is None:
+        set_accounts(load_accounts())
+    return ACCOUNTS
+
+def active_accounts():
+    return [a for a in get_accounts() if a.get("active", True)]
+
+def load_config(actor_input=None, accounts_file=None):
+    """Apply run configuration explicitly, once, before any engine starts.
+
+    `actor_input` is the Apify input (accounts plus optional overrides);
+    without injected accounts they are read from `accounts_file`/accounts.csv.
+    """
+    global ACCOUNTS_FILE, SESSION_TTL, DISCOVERY_TTL, FORCE_DISCOVERY, TIMING_PROFILE, LOGIN_PREFETCH, RATE_LIMIT
+    global LOW_MEMORY, MEMORY_LIMIT_MB
+    actor_input = actor_input or {}
+    if accounts_file:
+        # Status updates go back to the file the accounts came from
+        ACCOUNTS_FILE = ACCOUNT_STATE.path = accounts_file
+    if actor_input.get("accounts"):
+        set_accounts(actor_input["accounts"])
+        log(f"Loaded {len(ACCOUNTS)} accounts from input.")
+    else:
+        set_accounts(load_accounts(ACCOUNTS_FILE))
+    if "session_ttl_minutes" in actor_input:
+        SESSION_TTL = int(actor_input["session_ttl_minutes"]) * 60
+    if "discovery_ttl_minutes" in actor_input:
+        DISCOVERY_TTL = int(actor_input["discovery_ttl_minutes"]) * 60
+    if actor_input.get("force_refresh_discovery"):
+        FORCE_DISCOVERY = True
+    if actor_input.get("timing_profile"):
+        TIMING_PROFILE = actor_input["timing_profile"]
+    if "login_prefetch" in actor_input:
+        LOGIN_PREFETCH = int(actor_input["login_prefetch"])
+    if "rate_limit" in actor_input:
+        RATE_LIMIT = float(actor_input["rate_limit"])
+    if actor_input.get("low_memory"):
+        LOW_MEMORY = True
+    if actor_input.get("memory_limit_mb"):
+        MEMORY_LIMIT_MB = int(actor_input["memory_limit_mb"])
+    return ACCOUNTS
+
+def account_to_input(account):
+    """One account in the Apify input schema's shape."""
+    return {k: account.get(k, "") for k in
+            ("name", "username", "password", "crn", "pin", "dp_id", "bank_name", "active", "available_banks")}
+
+class AccountStateStore:
+    """Collects per-account column updates in memory and writes accounts.csv once.
+
+    `flush()` re-reads the file, applies every pending change and swaps the
+    result in with a temp file + rename, so readers never see a half-written
+    file. Column layout and encoding are left exactly as they were.
+    """
+
+    # A flush holds the file lock for milliseconds; one older than this was left by a crashed process
+    LOCK_STALE_SECONDS = 30
+
+    def __init__(self, path=ACCOUNTS_FILE):
+        self.path = path
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def set(self, username, column, value):
+        with self.lock:
+            self.pending.setdefault(username, {})[column] = value
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending or not os.path.exists(self.path):
+            return 0
+        lock_path = self.path + ".lock"
+        locked = False
+        try:
+            # Shard processes share accounts.csv; serialise their read-modify-write cycles
+            self._acquire(lock_path)
+            locked = True
+            rows = []
+            updated = 0
+            with open(self.path, mode='r', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                fieldnames = list(reader.fieldnames)
+                for row in reader:
+                    changes = pending.get(row.get("Username"))
+                    if changes:
+                        row.update(changes)
+                        updated += 1
+                    rows.append(row)
+            for column in {c for changes in pending.values() for c in changes}:
+                if column not in fieldnames:
+                    fieldnames.append(column)
+
+            fd, tmp_path = tempfile.mkstemp(prefix=".accounts-", suffix=".csv", dir=os.path.dirname(os.path.abspath(self.path)))
+            with os.fdopen(fd, mode='w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(rows)
+            os.replace(tmp_path, self.path)
+            return updated
+        except Exception as e:
+            log(f"Error updating CSV: {e}", level="ERROR")
+            # Keep the changes for the next attempt, without clobbering newer ones
+            with self.lock:
+                for username, changes in pending.items():
+                    self.pending[username] = {**changes, **self.pending.get(username, {})}
+            return 0
+        finally:
+            # Only the lock this flush created; another process may hold it otherwise
+            if locked:
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+
+    def _acquire(self, lock_path, timeout=10):
+        """Create `lock_path` exclusively. Raises TimeoutError while another process holds it."""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL))
+                return
+            except FileExistsError:
+                try:
+                    age = time.time() - os.path.getmtime(lock_path)
+                except OSError:
+                    # Released in the meantime
+                    continue
+                if age > self.LOCK_STALE_SECONDS:
+                    log(f"Taking over stale lock {lock_path} ({int(age)}s old).", level="WARNING")
+                    try:
+                        os.remove(lock_path)
+                    except OSError:
+                        pass
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"{lock_path} is held by another process")
+                time.sleep(0.05)
+
+ACCOUNT_STATE = AccountStateStore()
+
+def flush_account_state():
+    updated = ACCOUNT_STATE.flush()
+    if updated:
+        log(f"Saved status for {updated} accounts to {ACCOUNT_STATE.path}.")
+
+async def flush_account_state_periodically(interval):
+    """Background task: flush pending account updates every `interval` seconds."""
+    import asyncio
+    while True:
+        await asyncio.sleep(interval)
+        flush_account_state()
 
 def update_account_status(username, key, value):
-    """Update status in CSV. For simplicity, we write to the 'Status' column or just log."""
+    """Record a status change for the 'Status' column; written out by `flush_account_state`."""
     if os.environ.get("APIFY_RUNNING") == "true":
         return # Skip CSV update on Apify
-    try:
-        temp_accounts = []
-        updated = False
-        with open(ACCOUNTS_FILE, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames
-            for row in reader:
-                if row["Username"] == username:
-                    row["Status"] = "OK" if value else f"Failed {key}"
-                    updated = True
-                temp_accounts.append(row)
-        
-        if updated:
-            with open(ACCOUNTS_FILE, mode='w', encoding='utf-8-sig', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(temp_accounts)
-    except Exception as e:
-        log(f"Error updating CSV: {e}")
+    ACCOUNT_STATE.set(username, "Status", "OK" if value else f"Failed {key}")
 
 def save_account_banks(username, banks_list):
-    """Save the list of available banks to accounts.csv for a specific user."""
+    """Record the list of available banks for a user; written out by `flush_account_state`."""
     if os.environ.get("APIFY_RUNNING") == "true":
         return # Skip CSV update on Apify
-    try:
-        temp_accounts = []
-        updated = False
-        
-        # Convert list of dicts or strings to a pipe-separated string
-        # Assuming banks_list might be [{"text": "Bank A", "value": "1"}, ...] or just list of names
-        # We will store just the names for readability, or maybe Name:Value
-        
-        bank_names = []
-        for b in banks_list:
-            if isinstance(b, dict):
-                bank_names.append(b.get("text", "").strip())
-            else:
-                bank_names.append(str(b).strip())
-        
-        banks_str = "|".join(bank_names)
-
-        with open(ACCOUNTS_FILE, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames
-            
-            # Ensure 'Available Banks' column exists
-            if "Available Banks" not in fieldnames:
-                fieldnames.append("Available Banks")
-            
-            for row in reader:
-                if row["Username"] == username:
-                    row["Available Banks"] = banks_str
-                    updated = True
-                temp_accounts.append(row)
-        
-        if updated:
-            with open(ACCOUNTS_FILE, mode='w', encoding='utf-8-sig', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(temp_accounts)
-            log(f"Updated available banks for {username}")
-    except Exception as e:
-        log(f"Error updating available banks in CSV: {e}")
+
+    # Convert list of dicts or strings to a pipe-separated string
+    # We store just the names for readability
+    bank_names = []
+    for b in banks_list:
+        if isinstance(b, dict):
+            bank_names.append(b.get("text", "").strip())
+        else:
+            bank_names.append(str(b).strip())
+
+    ACCOUNT_STATE.set(username, "Available Banks", "|".join(bank_names))
@@ -0,0 +1,50 @@
+import time
+import config_and_utils
+from config_and_utils import log
+import kv_storage
+
+# Last discovery result with a timestamp, shared by later runs, manual checks
+# and shards so they can skip the discovery login while it is fresh. Stored
+# in a local JSON file, or in a named key-value store on Apify.
+
+CACHE_FILE = "discovery_cache.json"
+CACHE_STORE_NAME = "meroshare-discovery"
+CACHE_KEY = "IPOS"
+
+async def _read():
+    return await kv_storage.read(CACHE_FILE, CACHE_STORE_NAME, CACHE_KEY)
+
+async def _write(entry):
+    await kv_storage.write(CACHE_FILE, CACHE_STORE_NAME, CACHE_KEY, entry)
+
+async def load_ipos():
+    """Cached IPO list if younger than DISCOVERY_TTL (and no refresh is forced), else None."""
+    ttl = config_and_utils.DISCOVERY_TTL
+    if ttl <= 0 or config_and_utils.FORCE_DISCOVERY:
+        return None
+    try:
+        entry = await _read()
+    except Exception as e:
+        log(f"Discovery cache read error: {e}")
+        return None
+    if not entry:
+        return None
+    age = time.time() - entry.get("saved_at", 0)
+    if age > ttl:
+        return None
+    log(f"Using cached discovery from {int(age)}s ago ({len(entry['ipos'])} IPOs).")
+    return entry["ipos"]
+
+def shared_ipos(ipos):
+    """Copy of `ipos` without the discovering account's apply/edit state."""
+    return [{**ipo, "state": "apply", "url": ipo["url"].replace("/asba/edit/", "/asba/apply/")} for ipo in ipos]
+
+async def save_ipos(ipos):
+    # An empty result may just be a failed login or page load, so only real finds are cached
+    if config_and_utils.DISCOVERY_TTL <= 0 or not ipos:
+        return
+    # Apply/edit state belongs to the account that ran discovery, not to whoever reuses the list
+    try:
+        await _write({"saved_at": time.time(), "ipos": shared_ipos(ipos)})
+    except Exception as e:
+        log(f"Discovery cache write error: {e}")
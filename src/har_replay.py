@@ -0,0 +1,171 @@
+import asyncio
+import base64
+import glob
+import json
+import os
+import re
+import shutil
+import config_and_utils
+from config_and_utils import log
+import memory
+import request_filter
+
+# HAR record/replay for the browser engine. "record" gives every browser
+# context its own HAR file; "replay" serves all requests from those files with
+# no network, optionally with the recorded response times, and reports what the
+# run asked for that was not recorded (or recorded with a different body) and
+# what was recorded but never asked for.
+
+DIFF_FILE = "replay_diff.json"
+# History at the start of the recording, and the replay's own copy of it
+HISTORY_FILE = "history.csv"
+REPLAY_HISTORY_FILE = "replay_history.csv"
+# Where a replay keeps account status and its checkpoint instead of the real ones
+REPLAY_ACCOUNTS_FILE = "replay_accounts.csv"
+REPLAY_STATE_FILE = "replay_run_state.json"
+REPLAY_STATE_STORE_NAME = "meroshare-replay-run-state"
+# Recomputed from the body on replay
+SKIP_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+_counter = 0
+_replay = None
+
+def recording():
+    return config_and_utils.HAR_MODE == "record"
+
+def replaying():
+    return config_and_utils.HAR_MODE == "replay"
+
+def prepare():
+    """Called once per run before any context opens."""
+    global _counter, _replay
+    _counter = 0
+    if not config_and_utils.HAR_MODE:
+        return
+    # Cached sessions and IPO lists would skip exactly the traffic being recorded or replayed
+    config_and_utils.SESSION_TTL = 0
+    config_and_utils.DISCOVERY_TTL = 0
+    import history_tracker
+    os.makedirs(config_and_utils.HAR_DIR, exist_ok=True)
+    history_file = os.path.join(config_and_utils.HAR_DIR, HISTORY_FILE)
+    if recording():
+        # The recording submits real applications, so they go to the real history. The history it
+        # started from is kept, so the replay sees the same pending IPOs.
+        history_tracker.get_store().export_csv(history_file)
+        for path in glob.glob(os.path.join(config_and_utils.HAR_DIR, "*.har")):
+            os.remove(path)
+        log(f"Recording browser traffic to {config_and_utils.HAR_DIR}/")
+    elif replaying():
+        # Nothing is really submitted, so the replay writes to a scratch copy of that history
+        replay_history = os.path.join(config_and_utils.HAR_DIR, REPLAY_HISTORY_FILE)
+        if os.path.exists(replay_history):
+            os.remove(replay_history)
+        if os.path.exists(history_file):
+            shutil.copyfile(history_file, replay_history)
+        history_tracker._store = history_tracker.HistoryStore(csv_path=replay_history)
+        # Likewise account status and the run checkpoint: a replay must neither change nor consume the real ones
+        replay_accounts = os.path.join(config_and_utils.HAR_DIR, REPLAY_ACCOUNTS_FILE)
+        if os.path.exists(config_and_utils.ACCOUNTS_FILE):
+            shutil.copyfile(config_and_utils.ACCOUNTS_FILE, replay_accounts)
+        config_and_utils.ACCOUNT_STATE.path = replay_accounts
+        import checkpoint
+        checkpoint.STATE_FILE = os.path.join(config_and_utils.HAR_DIR, REPLAY_STATE_FILE)
+        checkpoint.STATE_STORE_NAME = REPLAY_STATE_STORE_NAME
+        if os.path.exists(checkpoint.STATE_FILE):
+            os.remove(checkpoint.STATE_FILE)
+        _replay = HarReplay(sorted(glob.glob(os.path.join(config_and_utils.HAR_DIR, "*.har"))))
+        log(f"Replaying {_replay.total} recorded requests from {config_and_utils.HAR_DIR}/ (no network).")
+
+async def new_context(browser, name=None):
+    """browser.new_context() set up for the current HAR mode."""
+    global _counter
+    if recording():
+        _counter += 1
+        label = re.sub(r"[^A-Za-z0-9_.-]", "_", name or "context")
+        path = os.path.join(config_and_utils.HAR_DIR, f"{_counter:03d}_{label}.har")
+        return await browser.new_context(**memory.context_options(record_har_path=path, record_har_content="embed"))
+    if replaying():
+        return await browser.new_context(**memory.context_options(service_workers="block"))
+    return await browser.new_context(**memory.context_options())
+
+async def install_replay(context):
+    """Serve `context` from the recorded HARs. Install after the request filter so this route runs first."""
+    if replaying():
+        await context.route("**/*", _replay.handle)
+
+class HarReplay:
+    def __init__(self, paths):
+        # (method, url) -> {post body: [entries in recorded order]}
+        self.entries = {}
+        self.cursor = {}
+        self.used = set()
+        self.missing = []
+        self.changed = []
+        self.total = 0
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                for entry in json.load(f)["log"]["entries"]:
+                    # Requests aborted while recording have no response to replay
+                    if entry["response"].get("status", 0) <= 0:
+                        continue
+                    req = entry["request"]
+                    body = (req.get("postData") or {}).get("text") or ""
+                    self.entries.setdefault((req["method"], req["url"]), {}).setdefault(body, []).append(entry)
+                    self.total += 1
+
+    def pick(self, key, body):
+        """Next recorded entry for this request; repeats of a request are served in recorded order."""
+        bodies = self.entries[key]
+        if body not in bodies:
+            self.changed.append({"method": key[0], "url": key[1], "post_data": body})
+            body = next(iter(bodies))
+        seq = bodies[body]
+        i = self.cursor.get((key, body), 0)
+        self.cursor[(key, body)] = i + 1
+        self.used.add((key, body, min(i, len(seq) - 1)))
+        return seq[min(i, len(seq) - 1)]
+
+    async def handle(self, route):
+        request = route.request
+        key = (request.method, request.url)
+        if key not in self.entries:
+            if request_filter.blocked_kind(request, request_filter.blocked_types(), request_filter.allowed_hosts()):
+                # Recorded runs never fetched these either; let the request filter abort them
+                await route.fallback()
+                return
+            self.missing.append({"method": request.method, "url": request.url})
+            await route.abort()
+            return
+
+        entry = self.pick(key, request.post_data or "")
+        response = entry["response"]
+        content = response.get("content", {})
+        text = content.get("text") or ""
+        body = base64.b64decode(text) if content.get("encoding") == "base64" else text.encode("utf-8")
+        headers = {h["name"]: h["value"] for h in response.get("headers", []) if h["name"].lower() not in SKIP_HEADERS}
+        if config_and_utils.HAR_TIMING and entry.get("time", 0) > 0:
+            await asyncio.sleep(entry["time"] / 1000)
+        await route.fulfill(status=response["status"], headers=headers, body=body)
+
+    def diff(self):
+        unused = []
+        for key, bodies in self.entries.items():
+            for body, seq in bodies.items():
+                for i in range(len(seq)):
+                    if (key, body, i) not in self.used:
+                        unused.append({"method": key[0], "url": key[1], "post_data": body})
+        return {"missing": self.missing, "changed": self.changed, "unused": unused}
+
+def write_diff():
+    """Write the replay diff next to the HAR files; returns counts for the run report (None when not replaying)."""
+    if not replaying() or _replay is None:
+        return None
+    diff = _replay.diff()
+    path = os.path.join(config_and_utils.HAR_DIR, DIFF_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(diff, f, indent=2)
+    counts = {k: len(v) for k, v in diff.items()}
+    level = "WARNING" if counts["missing"] or counts["changed"] else "INFO"
+    log(f"Replay diff: {counts['missing']} missing, {counts['changed']} changed, "
+        f"{counts['unused']} unused recorded requests (see {path}).", level=level)
+    return counts
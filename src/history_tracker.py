@@ -1,22 +1,245 @@
 import csv
 import os
 import time
-from config_and_utils import COMPLETED_FILE, log
+import config_and_utils
+from config_and_utils import COMPLETED_FILE, HISTORY_DB, log
+import kv_storage
+
+FIELDNAMES = ['Name', 'Username', 'BOID', 'Company', 'URL', 'Applied At']
+
+# On Apify the container filesystem does not survive a run, so the history is
+# also kept in a named key-value store: loaded into the index when a run starts
+# and written back at the end of the run and on the platform's persist-state,
+# migrating and aborting events. New records go to the dataset in batches.
+# Shard runs leave the store to their coordinator, which merges their datasets.
+HISTORY_STORE_NAME = "meroshare-history"
+HISTORY_KEY = "HISTORY"
+
+class HistoryStore:
+    """Application history with a `(username, company)` index loaded once per run.
+
+    `history.csv` is always appended to, so it stays the readable import/export
+    format. When `db_path` is set, records are also kept in an indexed SQLite
+    file (seeded from the CSV the first time) and filtered queries run there.
+
+    Records added with `add()` are also queued in `pending` until
+    `flush_history()` pushes them to the Apify dataset.
+    """
+
+    def __init__(self, csv_path=COMPLETED_FILE, db_path=None):
+        self.csv_path = csv_path
+        self.db_path = db_path
+        self.db = None
+        self.index = set()
+        self.pending = []
+        self.load()
+
+    def load(self):
+        if self.db_path:
+            self._open_db()
+            rows = self.db.execute("SELECT username, company FROM history")
+            self.index = {(u, c) for u, c in rows}
+            return
+        self.index = {(row.get('Username'), row.get('Company')) for row in self._read_csv()}
+
+    def _open_db(self):
+        import sqlite3
+        is_new = not os.path.exists(self.db_path)
+        self.db = sqlite3.connect(self.db_path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS history (
+                name TEXT, username TEXT NOT NULL, boid TEXT, company TEXT NOT NULL,
+                url TEXT, applied_at TEXT, PRIMARY KEY (username, company)
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_history_company ON history(company)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_history_applied_at ON history(applied_at)")
+        if is_new:
+            self.import_csv(self.csv_path)
+        self.db.commit()
+
+    def _read_csv(self, path=None):
+        path = path or self.csv_path
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, mode='r', encoding='utf-8-sig') as f:
+                yield from csv.DictReader(f)
+        except Exception as e:
+            log(f"Error reading history {path}: {e}")
+
+    def import_csv(self, path):
+        rows = [tuple(row.get(k, '') for k in FIELDNAMES) for row in self._read_csv(path)]
+        self.db.executemany("INSERT OR IGNORE INTO history VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+        log(f"Imported {len(rows)} history records from {path}.")
+
+    def export_csv(self, path):
+        with open(path, mode='w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.query())
+
+    def contains(self, username, company_name):
+        return (username, company_name) in self.index
+
+    def add(self, record):
+        """Store a record unless `(Username, Company)` is already known. Returns True if added."""
+        if not self.merge([record]):
+            return False
+        self.pending.append(record)
+        return True
+
+    def merge(self, records):
+        """Store every record whose `(Username, Company)` is not known yet, without queueing it. Returns the number added."""
+        new = []
+        for record in records:
+            key = (record.get('Username'), record.get('Company'))
+            if key in self.index:
+                continue
+            self.index.add(key)
+            new.append(record)
+        if not new:
+            return 0
+
+        file_exists = os.path.exists(self.csv_path)
+        with open(self.csv_path, mode='a', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES, extrasaction='ignore')
+            if not file_exists:
+                writer.writeheader()
+            writer.writerows(new)
+
+        if self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO history VALUES (?, ?, ?, ?, ?, ?)",
+                [tuple(record.get(k, '') for k in FIELDNAMES) for record in new],
+            )
+            self.db.commit()
+        return len(new)
+
+    def take_pending(self):
+        pending, self.pending = self.pending, []
+        return pending
+
+    def query(self, username=None, company=None, since=None, until=None):
+        """Records filtered by user, company and an inclusive `Applied At` range.
+
+        `since`/`until` use the stored "%Y-%m-%d %H:%M:%S" format (a bare date works too).
+        """
+        if until and len(until) == 10:
+            until += " 23:59:59"
+        if self.db:
+            clauses, params = [], []
+            for column, op, value in (("username", "=", username), ("company", "=", company),
+                                      ("applied_at", ">=", since), ("applied_at", "<=", until)):
+                if value:
+                    clauses.append(f"{column} {op} ?")
+                    params.append(value)
+            sql = "SELECT * FROM history"
+            if clauses:
+                sql += " WHERE " + " AND ".join(clauses)
+            sql += " ORDER BY applied_at"
+            return [dict(zip(FIELDNAMES, row)) for row in self.db.execute(sql, params)]
+
+        result = []
+        for row in self._read_csv():
+            applied_at = row.get('Applied At', '')
+            if username and row.get('Username') != username:
+                continue
+            if company and row.get('Company') != company:
+                continue
+            if since and applied_at < since:
+                continue
+            if until and applied_at > until:
+                continue
+            result.append(row)
+        return result
+
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = HistoryStore(db_path=HISTORY_DB)
+    return _store
 
 def is_already_completed(username, company_name):
-    if not os.path.exists(COMPLETED_FILE): 
-        return False
     try:
-        with open(COMPLETED_FILE, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            return any(row['Username'] == username and row['Company'] == company_name for row in reader)
-    except: 
+        return get_store().contains(username, company_name)
+    except:
         return False
 
+def pending_accounts(accounts, ipos):
+    """Accounts with at least one of `ipos` not yet in history."""
+    return [acc for acc in accounts if any(not is_already_completed(acc['username'], ipo['company']) for ipo in ipos)]
+
+async def _read_remote():
+    rows = await (await kv_storage.open_store(HISTORY_STORE_NAME)).get_value(HISTORY_KEY) or []
+    return [dict(zip(FIELDNAMES, row)) for row in rows]
+
+_write_back = True
+
+async def load_history(write_back=True):
+    """On Apify, seed this run's history from the history store. Returns the number of records loaded.
+
+    With `write_back=False` (a shard run) `save_history()` leaves the store to the coordinator.
+    """
+    global _write_back
+    _write_back = write_back
+    if os.environ.get("APIFY_RUNNING") != "true":
+        return 0
+    try:
+        records = await _read_remote()
+    except Exception as e:
+        log(f"History store read error: {e}")
+        return 0
+    get_store().merge(records)
+    log(f"Loaded {len(records)} history records from the {HISTORY_STORE_NAME} store.")
+    return len(records)
+
+_remote_stale = False
+
+async def flush_history():
+    """Push records saved since the last flush to the Apify dataset in one call.
+
+    Returns the number of records pushed (always 0 outside Apify).
+    """
+    global _remote_stale
+    store = get_store()
+    pending = store.take_pending()
+    if os.environ.get("APIFY_RUNNING") != "true" or not pending:
+        return 0
+    from apify import Actor
+    try:
+        await Actor.push_data(pending)
+    except Exception as e:
+        log(f"Error pushing to Apify: {e}")
+        # Keep them for the next flush
+        store.pending = pending + store.pending
+        return 0
+    _remote_stale = True
+    log(f"SUCCESS: {len(pending)} records pushed to Apify Dataset.")
+    return len(pending)
+
+async def save_history():
+    """Write the full history back to the history store, if this run added to it.
+
+    Its size grows with the whole history, so this runs only at the end of a run and on
+    Apify's persist-state, migrating and aborting events, not per batch.
+    """
+    global _remote_stale
+    if os.environ.get("APIFY_RUNNING") != "true" or not _remote_stale or not _write_back:
+        return
+    store = get_store()
+    try:
+        # Other runs may have saved records since this one loaded; keep theirs too
+        store.merge(await _read_remote())
+        rows = [[record.get(k, '') for k in FIELDNAMES] for record in store.query()]
+        await (await kv_storage.open_store(HISTORY_STORE_NAME)).set_value(HISTORY_KEY, rows)
+        _remote_stale = False
+    except Exception as e:
+        log(f"History store write error: {e}")
+
 async def save_completion(account_name, username, boid, company_name, url, crn=None, active=True, selected_bank=None, available_banks=None):
-    file_exists = os.path.exists(COMPLETED_FILE)
-    fieldnames = ['Name', 'Username', 'BOID', 'Company', 'URL', 'Applied At']
-    
     timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
     record = {
         'Name': account_name,
@@ -31,102 +254,71 @@ async def save_completion(account_name, username, boid, company_name, url, crn=N
         'Available Banks': available_banks
     }
 
-    # 1. Apify Output
-    if os.environ.get("APIFY_RUNNING") == "true":
-        try:
-            from apify import Actor
-            await Actor.push_data(record)
-            log(f"SUCCESS: {account_name} record pushed to Apify Dataset.")
-        except Exception as e:
-            log(f"Error pushing to Apify: {e}")
-
-    # 2. Local CSV Output (Skip checks if on Apify since ephemeral)
+    # Local history (duplicates are dropped by the store's index)
+    store = get_store()
     try:
-        # Check if already exists to prevent duplicate rows in CSV (Local only)
-        if os.environ.get("APIFY_RUNNING") != "true" and is_already_completed(username, company_name):
-            return
-
-        with open(COMPLETED_FILE, mode='a', encoding='utf-8-sig', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            if not file_exists:
-                writer.writeheader()
-            
-            writer.writerow(record)
-        
-        if os.environ.get("APIFY_RUNNING") != "true":
-             log(f"SUCCESS: {account_name} record saved for {company_name}.")
+        if store.add(record):
+            log(f"SUCCESS: {account_name} record saved for {company_name}.")
     except Exception as e:
-        # On Apify, CSV errors are expected if not found, suppress them or log debug
-        if os.environ.get("APIFY_RUNNING") != "true":
-            log(f"Error saving history to CSV: {e}")
+        log(f"Error saving history to CSV: {e}")
 
-def get_applied_list():
-    if not os.path.exists(COMPLETED_FILE):
-        return []
-    data = []
+    # Apify output goes out in batches (and at the end of the run)
+    if len(store.pending) >= config_and_utils.HISTORY_BATCH:
+        await flush_history()
+
+def get_applied_list(username=None, company=None, since=None, until=None):
     try:
-        with open(COMPLETED_FILE, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                data.append(row)
+        return get_store().query(username=username, company=company, since=since, until=until)
     except:
-        pass
-    return data
+        return []
 
 def migrate_json_history():
     """Check for completed_applications.json and migrate to CSV."""
     import json
     import shutil
-    
+
     # Check current and parent directory
     json_candidates = ["completed_applications.json", "../completed_applications.json"]
-    
+
     for json_path in json_candidates:
         if os.path.exists(json_path):
             try:
                 log(f"Found legacy history: {json_path}. Migrating...")
                 with open(json_path, 'r', encoding='utf-8') as f:
                     old_data = json.load(f)
-                
+
                 if not isinstance(old_data, list):
                     log(f"Skipping {json_path}: Not a list.")
                     continue
 
+                store = get_store()
                 count = 0
                 for item in old_data:
                     company = item.get('company')
                     username = item.get('username')
-                    
+
                     if company and username:
-                        if not is_already_completed(username, company):
-                            # Append to CSV
-                             save_completion(
-                                item.get('user_name', ''),
-                                username,
-                                item.get('boid', ''),
-                                company,
-                                item.get('url', '')
-                            )
-                             count += 1
-                
+                        added = store.add({
+                            'Name': item.get('user_name', ''),
+                            'Username': username,
+                            'BOID': item.get('boid', ''),
+                            'Company': company,
+                            'URL': item.get('url', ''),
+                            'Applied At': item.get('applied_at', ''),
+                        })
+                        if added:
+                            count += 1
+
                 log(f"Migrated {count} records from {json_path}.")
-                
+
                 # Backup/Rename to avoid re-migration
                 shutil.move(json_path, json_path + ".bak")
                 log(f"Renamed {json_path} to {json_path}.bak")
-                
+
             except Exception as e:
                 log(f"Error migrating {json_path}: {e}")
 
 if __name__ == "__main__":
-    # Auto-migrate on run
-    migrate_json_history()
-
-    history = get_applied_list()
-    if not history:
-        print("No application history found.")
-    else:
-        print(f"{'Username':<15} | {'Company':<30} | {'Date':<20}")
-        print("-" * 70)
-        for entry in history:
-            print(f"{entry.get('Username', 'N/A'):<15} | {entry.get('Company', 'N/A'):<30} | {entry.get('Applied At', 'N/A'):<20}")
+    import sys
+    from cli import main as cli_main
+    sys.exit(cli_main(["history"] + sys.argv[1:]))
@@ -1,10 +1,68 @@
-import asyncio
-from config_and_utils import log
+from config_and_utils import APP_URL, log
+import throttle
+
+def parse_applicable_issues(payload, app_url=APP_URL):
+    """Turn an `applicableIssue` API response into discovery entries.
+
+    Each entry keeps the `company`/`url` keys the rest of the bot relies on and
+    adds `share_type`, `issue_id` and `state` ("apply" or "edit").
+    """
+    items = payload.get("object", []) if isinstance(payload, dict) else (payload or [])
+    ipos = []
+    for item in items:
+        issue_id = item.get("companyShareId")
+        if issue_id is None:
+            continue
+        action = str(item.get("action") or "").lower()
+        state = "edit" if action in ("edit", "inprocess") else "apply"
+        ipos.append({
+            # Same trimming as the row-text scrape so history keys match across engines
+            "company": (item.get("companyName") or f"IPO_Item_{issue_id}").split("-")[0].strip(),
+            "url": f"{app_url}/#/asba/{state}/{issue_id}",
+            "share_type": item.get("shareTypeName", ""),
+            "share_group": item.get("shareGroupName", ""),
+            "scrip": item.get("scrip", ""),
+            "issue_id": issue_id,
+            "state": state,
+        })
+    return ipos
+
+ISSUE_LIST_MARKER = "applicableIssue"
+
+# Reads every Apply/Edit row of the ASBA list in one round trip.
+ROWS_JS = """() => Array.from(document.querySelectorAll('button'))
+    .filter(b => /apply|edit/i.test(b.innerText))
+    .map((btn, i) => {
+        const row = btn.closest('tr') || btn.closest('.company-list') || btn.closest('.card');
+        return { index: i, text: row ? row.innerText : '', action: /edit/i.test(btn.innerText) ? 'edit' : 'apply' };
+    })"""
+
+def parse_row(row):
+    lines = [l.strip() for l in row.get("text", "").split("\n") if l.strip()]
+    company = lines[0].split("-")[0].strip() if lines else ""
+    if not company or company.lower() in ['apply', 'edit']:
+        company = f"IPO_Item_{row['index'] + 1}"
+    share_type = next((l for l in lines[1:] if "share" in l.lower()), "")
+    return {"company": company, "share_type": share_type, "state": row.get("action", "apply")}
 
 async def discover_available_ipos(page):
+    """Collect every open issue from a single load of the ASBA page.
+
+    Issue IDs come from the `applicableIssue` response the SPA fetches while
+    rendering; the apply/edit state comes from the rendered buttons. Only when
+    the response cannot be captured do we fall back to clicking each row.
+    """
     log("Discovering available IPOs...")
     try:
-        await page.goto("https://meroshare.cdsc.com.np/#/asba", wait_until="networkidle")
+        payload = None
+        try:
+            await throttle.scheduler().acquire()
+            async with page.expect_response(lambda r: ISSUE_LIST_MARKER in r.url, timeout=15000) as resp_info:
+                await page.goto(f"{APP_URL}/#/asba", wait_until="networkidle")
+            payload = await (await resp_info.value).json()
+        except Exception as e:
+            log(f"Issue list response not captured ({e}). Using page content only.")
+
         # Ensure at least one Apply/Edit button or a container is present
         try:
             await page.wait_for_selector("button:has-text('Apply'), button:has-text('Edit')", timeout=15000)
@@ -12,51 +70,42 @@ async def discover_available_ipos(page):
             log("No Apply/Edit buttons appeared after timeout.")
             return []
 
-        available_ipos = []
-        buttons = await page.query_selector_all("button:has-text('Apply'), button:has-text('Edit')")
-        log(f"Found {len(buttons)} entries on ASBA page.")
-        
-        for i in range(len(buttons)):
-            current_btns = await page.query_selector_all("button:has-text('Apply'), button:has-text('Edit')")
-            if i >= len(current_btns): 
-                break
-            btn = current_btns[i]
-            
-            # Identify company name before clicking
-            try:
-                # Use a single line JS string to avoid Python syntax errors with multi-line strings in evaluate
-                js_code = "(btn) => { const row = btn.closest('tr') || btn.closest('.company-list') || btn.closest('.card'); return row ? row.innerText : ''; }"
-                parent_row = await page.evaluate(js_code, btn)
-                
-                if parent_row:
-                    company_name = parent_row.split("\n")[0].split("-")[0].strip()
-                else:
-                    company_name = f"IPO_Item_{i+1}"
-            except:
-                company_name = f"IPO_Item_{i+1}"
-
-            if not company_name or company_name.lower() in ['apply', 'edit']:
-                company_name = f"IPO_Item_{i+1}"
-
-            log(f"Checking item: {company_name}")
-            await btn.click()
-            await asyncio.sleep(5)
-            
-            # Capture any URL that looks like an application page
-            if "/asba/apply/" in page.url or "/asba/edit/" in page.url:
-                available_ipos.append({"company": company_name, "url": page.url})
-                log(f"Valid IPO Target Found: {company_name} -> {page.url}")
-                await page.goto("https://meroshare.cdsc.com.np/#/asba")
-                await asyncio.sleep(4)
-                try:
-                    await page.locator(".nav-link:has-text('Apply for Issue')").click()
-                    await asyncio.sleep(3)
-                except:
-                    pass
-            else:
-                log(f"Clicked but didn't go to application page (URL: {page.url}). Ignoring.")
+        rows = [parse_row(r) for r in await page.evaluate(ROWS_JS)]
+        log(f"Found {len(rows)} entries on ASBA page.")
+
+        if payload is not None:
+            app_url = page.url.split("#")[0].rstrip("/") or APP_URL
+            available_ipos = parse_applicable_issues(payload, app_url)
+            # The rendered button is the authority on whether this account already applied
+            for ipo in available_ipos:
+                row = next((r for r in rows if r["company"].lower() == ipo["company"].lower()), None)
+                if row and row["state"] != ipo["state"]:
+                    ipo["state"] = row["state"]
+                    ipo["url"] = f"{app_url}/#/asba/{row['state']}/{ipo['issue_id']}"
+        else:
+            available_ipos = await discover_by_clicking(page, rows)
 
+        for ipo in available_ipos:
+            log(f"Valid IPO Target Found: {ipo['company']} -> {ipo['url']}")
         return available_ipos
     except Exception as e:
         log(f"Discovery Error: {e}")
         return []
+
+async def discover_by_clicking(page, rows):
+    """Fallback: open each row once to learn its URL, then step back to the list."""
+    available_ipos = []
+    buttons = page.locator("button:has-text('Apply'), button:has-text('Edit')")
+    for row in rows:
+        log(f"Checking item: {row['company']}")
+        await buttons.nth(row["index"]).click()
+        try:
+            await page.wait_for_url("**/asba/*/*", timeout=10000)
+        except:
+            log(f"Clicked but didn't go to application page (URL: {page.url}). Ignoring.")
+            continue
+        issue_id = page.url.rstrip("/").rsplit("/", 1)[-1]
+        available_ipos.append({**row, "url": page.url, "issue_id": issue_id})
+        await page.go_back()
+        await buttons.first.wait_for(timeout=15000)
+    return available_ipos
@@ -0,0 +1,35 @@
+import json
+import os
+
+# State kept between runs: a JSON file locally, or a value in a named
+# key-value store on Apify, where the container filesystem does not survive runs.
+
+async def open_store(store_name):
+    from apify import Actor
+    return await Actor.open_key_value_store(name=store_name)
+
+async def read(path, store_name, key):
+    """The value under `key` in `store_name` on Apify, else the JSON file at `path` (None if missing)."""
+    if os.environ.get("APIFY_RUNNING") == "true":
+        return await (await open_store(store_name)).get_value(key)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+async def write(path, store_name, key, value):
+    """Save `value` under `key` in `store_name` on Apify, else to `path`. None clears it."""
+    if os.environ.get("APIFY_RUNNING") == "true":
+        await (await open_store(store_name)).set_value(key, value)
+        return
+    if value is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written aside and moved into place, so a crash never leaves a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
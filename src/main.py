@@ -15,14 +15,30 @@ async def main():
         
         print("Starting IPO Bot on Apify...")
         
-        # Inject accounts from input if present
-        if actor_input.get("accounts"):
-            print(f"Loaded {len(actor_input['accounts'])} accounts from Input.")
-            import config_and_utils
-            config_and_utils.ACCOUNTS = actor_input['accounts']
-        
+        # Accounts and overrides from the input reach every engine through config_and_utils
+        import config_and_utils
+        config_and_utils.load_config(actor_input)
+
+        mode = actor_input.get("mode", "browser")
+        shard_count = int(actor_input.get("shard_count") or 1)
+        if shard_count > 1 and actor_input.get("shard_index") is None:
+            # Coordinator: discover once, start one run per shard, merge their results
+            from sharding import run_apify
+            await run_apify(shard_count, actor_input, headless=True, mode=mode)
+            return
+
         # Run the bot in headless mode (enforced on Apify)
-        await run_bot(headless=True)
+        await run_bot(
+            headless=True,
+            max_concurrency=actor_input.get("max_concurrency", 1),
+            mode=mode,
+            available_ipos=actor_input.get("ipos"),
+            shard_index=int(actor_input.get("shard_index") or 0),
+            shard_count=shard_count,
+            watch=bool(actor_input.get("watch")),
+            watch_interval=actor_input.get("watch_interval_seconds"),
+            watch_duration=int(actor_input["watch_duration_minutes"]) * 60 if "watch_duration_minutes" in actor_input else None,
+        )
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,44 +1,57 @@
-import asyncio
-import traceback
-from playwright.async_api import async_playwright
-from config_and_utils import ACCOUNTS, log
-from application_logic import login
+import config_and_utils
+from config_and_utils import log, flush_account_state
+from application_logic import login_with_cache
 from ipo_discovery import discover_available_ipos
+import memory
+import discovery_cache
+from bot_engine import open_context
 
-async def run_check():
+def print_ipos(available_ipos):
+    print("\n" + "="*80)
+    print(f"{'Company Name':<30} | {'Share Type':<20} | {'State':<5} | {'URL'}")
+    print("-" * 80)
+    for ipo in available_ipos:
+        print(f"{ipo['company']:<30} | {ipo.get('share_type', ''):<20} | {ipo.get('state', ''):<5} | {ipo['url']}")
+    print("="*80 + "\n")
+
+async def run_check(headless=False):
     log("=== Checking for Available IPOs ===")
-    
-    active_accounts = [a for a in ACCOUNTS if a.get("active", True)]
+
+    active_accounts = config_and_utils.active_accounts()
     if not active_accounts:
         log("No active accounts found in accounts.csv")
         return
 
+    # A fresh cached discovery needs no browser at all
+    cached = await discovery_cache.load_ipos()
+    if cached:
+        print_ipos(cached)
+        log("=== Check Finished ===")
+        return
+
+    from playwright.async_api import async_playwright
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False, slow_mo=800)
-        context = await browser.new_context()
+        browser = await memory.launch_browser(p, headless)
+        context = await open_context(browser, active_accounts[0]['username'])
         page = await context.new_page()
 
         log(f"Logging in with {active_accounts[0]['name']}...")
-        if await login(page, active_accounts[0]):
+        if await login_with_cache(page, active_accounts[0]):
             available_ipos = await discover_available_ipos(page)
-            
+
             if available_ipos:
-                print("\n" + "="*50)
-                print(f"{'Company Name':<30} | {'URL'}")
-                print("-" * 50)
-                for ipo in available_ipos:
-                    print(f"{ipo['company']:<30} | {ipo['url']}")
-                print("="*50 + "\n")
+                await discovery_cache.save_ipos(available_ipos)
+                print_ipos(available_ipos)
             else:
                 log("No available IPOs found.")
         else:
             log("Login failed during check.")
 
         await browser.close()
+        flush_account_state()
         log("=== Check Finished ===")
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(run_check())
-    except Exception:
-        log(f"CRASH: {traceback.format_exc()}")
+    import sys
+    from cli import main as cli_main
+    sys.exit(cli_main(["check"] + sys.argv[1:]))
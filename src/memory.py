@@ -0,0 +1,225 @@
+import asyncio
+import os
+import time
+import config_and_utils
+from config_and_utils import log
+
+# Low-memory browser mode for small containers (LOW_MEMORY). Chromium is
+# launched without the caches, GPU and compositor work the headless flow never
+# needs, and every context is built from one small template. A watcher samples
+# the resident memory of this process and its Chromium children. Near the
+# memory limit it lowers how many accounts may hold a context at once, and it
+# raises that number again when there is room. Peak memory is reported in every mode.
+
+LOW_MEMORY_ARGS = [
+    "--disable-gpu",
+    "--disable-gpu-compositing",
+    "--disable-software-rasterizer",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--no-first-run",
+    "--mute-audio",
+    "--disk-cache-size=1",
+    "--media-cache-size=1",
+    # One renderer per site instead of per frame/origin, and few of them
+    "--disable-site-isolation-trials",
+    "--disable-features=site-per-process,IsolateOrigins,Translate,MediaRouter,OptimizationHints,BackForwardCache",
+    "--renderer-process-limit=2",
+    "--js-flags=--max-old-space-size=256",
+]
+
+# Shared by every context in low-memory mode
+CONTEXT_TEMPLATE = {
+    "viewport": {"width": 1024, "height": 720},
+    "device_scale_factor": 1,
+    "reduced_motion": "reduce",
+    "service_workers": "block",
+}
+
+# Fractions of the limit above which concurrency is lowered, and below which it is raised again
+HIGH_WATER = 0.85
+LOW_WATER = 0.6
+
+def low_memory():
+    return config_and_utils.LOW_MEMORY
+
+def limit_mb():
+    """The memory ceiling: MEMORY_LIMIT_MB, or in low-memory mode 85% of the Apify container's memory (0 = none)."""
+    if config_and_utils.MEMORY_LIMIT_MB > 0:
+        return config_and_utils.MEMORY_LIMIT_MB
+    container = int(os.environ.get("ACTOR_MEMORY_MBYTES") or os.environ.get("APIFY_MEMORY_MBYTES") or 0)
+    return int(container * 0.85) if low_memory() else 0
+
+async def launch_browser(playwright, headless=False):
+    import waits
+    options = {"headless": headless, "slow_mo": waits.profile()["slow_mo"]}
+    if low_memory():
+        options["args"] = LOW_MEMORY_ARGS
+    return await playwright.chromium.launch(**options)
+
+def context_options(**options):
+    """browser.new_context() options: the shared template in low-memory mode, plus `options`."""
+    return {**CONTEXT_TEMPLATE, **options} if low_memory() else options
+
+def tree_rss_kb(root_pid=None):
+    """Resident memory of `root_pid` and all its descendants (Chromium included), in KB. Linux only."""
+    root_pid = root_pid or os.getpid()
+    parents = {}
+    rss = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+            parents[int(pid)] = int(fields["PPid"])
+            rss[int(pid)] = int(fields.get("VmRSS", "0 kB").split()[0])
+        except (OSError, KeyError, ValueError):
+            continue
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(child for child, parent in parents.items() if parent == pid)
+    return total
+
+def peak_rss_kb():
+    """Peak resident memory of this process and any finished children, in KB (0 where unavailable, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def current_rss_kb():
+    if os.path.isdir("/proc"):
+        return tree_rss_kb()
+    # Elsewhere only peaks are available
+    return peak_rss_kb()
+
+class AdaptiveLimit:
+    """Like asyncio.Semaphore, but its capacity can be lowered and raised while it is in use."""
+
+    def __init__(self, limit):
+        self.max = self.limit = max(1, limit)
+        self.lowest = self.limit
+        self.active = 0
+        self.cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, *exc):
+        async with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def lower(self):
+        # Holders keep what they have; fewer new ones get in
+        if self.limit > 1:
+            self.limit -= 1
+            self.lowest = min(self.lowest, self.limit)
+            return True
+        return False
+
+    def higher(self):
+        if self.limit < self.max:
+            self.limit += 1
+            asyncio.get_running_loop().create_task(self._wake())
+            return True
+        return False
+
+    async def _wake(self):
+        async with self.cond:
+            self.cond.notify_all()
+
+class MemoryWatcher:
+    def __init__(self, limit_mb, interval=1.0, settle=5.0):
+        self.limit_kb = limit_mb * 1024
+        self.interval = interval
+        # Closing contexts takes a while to show in RSS, so changes are spaced out
+        self.settle = settle
+        self.changed_at = 0.0
+        self.peak_kb = 0
+        self.rss_kb = 0
+        self.limits = []
+        self.lowest = None  # lowest capacity of limits already released
+        self.lowered = 0
+        self.raised = 0
+
+    def adapt(self, limit):
+        """Let the watcher resize `limit` (an AdaptiveLimit) to stay under the memory ceiling."""
+        if self.limit_kb:
+            self.limits.append(limit)
+
+    def release(self, limit):
+        """Stop resizing `limit` once its batch of accounts is done (watch mode starts one per new issue)."""
+        if limit in self.limits:
+            self.limits.remove(limit)
+            self.lowest = min(self.lowest or limit.lowest, limit.lowest)
+
+    def under_pressure(self):
+        return bool(self.limit_kb) and self.rss_kb > self.limit_kb * LOW_WATER
+
+    def sample(self):
+        self.rss_kb = current_rss_kb()
+        self.peak_kb = max(self.peak_kb, self.rss_kb)
+        if not self.limit_kb or time.monotonic() - self.changed_at < self.settle:
+            return
+        if self.rss_kb > self.limit_kb * HIGH_WATER:
+            if any([limit.lower() for limit in self.limits]):
+                self.lowered += 1
+                self.changed_at = time.monotonic()
+                log(f"Memory at {self.rss_kb // 1024} MB of {self.limit_kb // 1024} MB. "
+                    f"Lowering concurrency to {min(l.limit for l in self.limits)}.", level="WARNING")
+        elif self.rss_kb < self.limit_kb * LOW_WATER:
+            if any([limit.higher() for limit in self.limits]):
+                self.raised += 1
+                self.changed_at = time.monotonic()
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def report(self):
+        report = {"peak_rss_mb": round(self.peak_kb / 1024, 1), "limit_mb": self.limit_kb // 1024 or None,
+                  "low_memory": low_memory(), "concurrency_lowered": self.lowered, "concurrency_raised": self.raised}
+        lowest = [l.lowest for l in self.limits] + ([self.lowest] if self.lowest else [])
+        if lowest:
+            report["lowest_concurrency"] = min(lowest)
+        return report
+
+_watcher = None
+_task = None
+
+def start():
+    """Start sampling memory for this run."""
+    global _watcher, _task
+    _watcher = MemoryWatcher(limit_mb())
+    _task = asyncio.get_running_loop().create_task(_watcher.run())
+    if _watcher.limit_kb:
+        log(f"Keeping memory under {_watcher.limit_kb // 1024} MB.")
+
+def stop():
+    if _task:
+        _task.cancel()
+    if _watcher:
+        # One last sample, so even a run shorter than the interval has a peak
+        _watcher.sample()
+
+def watcher():
+    global _watcher
+    if _watcher is None:
+        _watcher = MemoryWatcher(0)
+    return _watcher
+
+def summary():
+    w = watcher()
+    return f"Memory: peak {w.peak_kb // 1024} MB" + (f" of {w.limit_kb // 1024} MB, concurrency lowered {w.lowered}x." if w.limit_kb else ".")
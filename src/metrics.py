@@ -0,0 +1,202 @@
+import asyncio
+import os
+import time
+import weakref
+from collections import deque
+import config_and_utils
+from config_and_utils import log
+import outcomes
+import perf_report
+
+# Live view of a running bot: accounts done/pending/failed, submissions per
+# minute, contexts in flight, login/submit latency histograms and retry
+# counts. Served in Prometheus text format on METRICS_PORT (off by default).
+# On Apify the same numbers go into the run's status message every
+# STATUS_INTERVAL seconds. Latencies come from the perf_report spans, so the
+# application flow itself has no extra bookkeeping.
+
+BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 30, 60)
+HISTOGRAM_STAGES = ("login", "submit")
+RATE_WINDOW = 60
+OK_OUTCOMES = (outcomes.SUCCESS, outcomes.ALREADY_APPLIED)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.values = deque(maxlen=500)  # recent values, for the p50 in the status message
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.values.append(value)
+
+class Metrics:
+    def __init__(self):
+        self.planned = set()
+        self.status = {}  # username -> "done" / "failed"
+        self.histograms = {stage: Histogram() for stage in HISTOGRAM_STAGES}
+        self.failures = {stage: 0 for stage in HISTOGRAM_STAGES}
+        self.submissions = 0
+        self.recent = deque()  # monotonic times of recent submissions
+        self.cursor = len(perf_report.SPANS)  # spans of a resumed run are already in the report
+        self.pipelines = weakref.WeakSet()  # browser-mode LoginPipelines
+
+    def scan(self):
+        """Fold in the spans recorded since the last call."""
+        now = time.monotonic()
+        spans = perf_report.SPANS
+        for record in spans[self.cursor:]:
+            stage = record["stage"]
+            if stage in self.histograms:
+                self.histograms[stage].observe(record["seconds"])
+                if not record["ok"]:
+                    self.failures[stage] += 1
+            if stage == "submit" and record["ok"]:
+                self.submissions += 1
+                self.recent.append(now)
+        self.cursor = len(spans)
+        while self.recent and now - self.recent[0] > RATE_WINDOW:
+            self.recent.popleft()
+
+    def accounts(self):
+        done = sum(1 for s in self.status.values() if s == "done")
+        failed = sum(1 for s in self.status.values() if s == "failed")
+        return {"done": done, "failed": failed, "pending": len(self.planned) - done - failed}
+
+    def per_minute(self):
+        return len(self.recent) * 60 / RATE_WINDOW
+
+    def in_flight(self):
+        return sum(p.sessions.active for p in self.pipelines)
+
+    def render(self):
+        """Prometheus text exposition format."""
+        import memory
+        import throttle
+        self.scan()
+        stats = throttle.scheduler().stats
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP ipo_bot_{name} {help_text}")
+            lines.append(f"# TYPE ipo_bot_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"ipo_bot_{name}{labels} {value}")
+
+        metric("accounts", "gauge", "Accounts in this run by status.",
+               [(f'{{status="{k}"}}', v) for k, v in self.accounts().items()])
+        metric("submissions_total", "counter", "Applications submitted.", [("", self.submissions)])
+        metric("submissions_per_minute", "gauge", f"Applications submitted in the last {RATE_WINDOW}s, per minute.",
+               [("", round(self.per_minute(), 2))])
+        metric("contexts_in_flight", "gauge", "Browser contexts held by accounts logging in or applying.", [("", self.in_flight())])
+        samples = []
+        for stage, h in self.histograms.items():
+            for bound, count in zip(BUCKETS, h.counts):
+                samples.append((f'_bucket{{stage="{stage}",le="{bound}"}}', count))
+            samples.append((f'_bucket{{stage="{stage}",le="+Inf"}}', h.count))
+            samples.append((f'_sum{{stage="{stage}"}}', round(h.sum, 3)))
+            samples.append((f'_count{{stage="{stage}"}}', h.count))
+        metric("stage_seconds", "histogram", "Login and submit latency.", samples)
+        metric("stage_failures_total", "counter", "Failed logins and submissions.",
+               [(f'{{stage="{k}"}}', v) for k, v in self.failures.items()])
+        metric("retries_total", "counter", "Retried login/Proceed clicks (browser mode) and requeued applications.",
+               [('{kind="click"}', stats["retries"]), ('{kind="requeue"}', stats["requeued"])])
+        metric("server_requests_total", "counter", "Paced requests to Meroshare.", [("", stats["requests"])])
+        metric("server_failures_total", "counter", "Failed or rate-limited Meroshare responses.", [("", stats["failures"])])
+        metric("breaker_opened_total", "counter", "Times the circuit breaker paused all workers.",
+               [("", throttle.scheduler().breaker.opened)])
+        metric("rss_bytes", "gauge", "Resident memory of the bot and its browser.", [("", memory.watcher().rss_kb * 1024)])
+        return "\n".join(lines) + "\n"
+
+    def status_message(self):
+        import throttle
+        self.scan()
+        a = self.accounts()
+        parts = [f"Accounts: {a['done']} done, {a['failed']} failed, {a['pending']} pending",
+                 f"{self.per_minute():.0f} applications/min"]
+        for stage, h in self.histograms.items():
+            if h.values:
+                parts.append(f"{stage} p50 {perf_report.percentile(list(h.values), 50)}s")
+        if self.pipelines:
+            parts.append(f"{self.in_flight()} contexts")
+        stats = throttle.scheduler().stats
+        parts.append(f"{stats['requeued']} requeued")
+        if stats["retries"]:
+            parts.append(f"{stats['retries']} click retries")
+        return " | ".join(parts)
+
+_metrics = Metrics()
+_server = None
+_ticker = None
+
+def plan(accounts):
+    _metrics.planned.update(acc['username'] for acc in accounts)
+
+def account_finished(acc, results):
+    failed = any(r['outcome'] not in OK_OUTCOMES for r in results)
+    _metrics.status[acc['username']] = "failed" if failed else "done"
+
+def watch_pipeline(pipeline):
+    """Count `pipeline`'s held contexts as in flight."""
+    _metrics.pipelines.add(pipeline)
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split()[1].decode() if len(request_line.split()) > 1 else "/"
+        if path.split("?")[0] in ("/", "/metrics"):
+            body, status = _metrics.render().encode("utf-8"), "200 OK"
+        else:
+            body, status = b"Not found\n", "404 Not Found"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+        await writer.drain()
+    except Exception as e:
+        log(f"Metrics request error: {e}", level="DEBUG")
+    finally:
+        writer.close()
+
+async def _tick(interval):
+    from apify import Actor
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await Actor.set_status_message(_metrics.status_message())
+        except Exception as e:
+            log(f"Status message error: {e}", level="DEBUG")
+
+async def start():
+    """Start collecting for this run; serve /metrics and update the Apify status message if configured."""
+    global _metrics, _server, _ticker
+    _metrics = Metrics()
+    port = config_and_utils.METRICS_PORT
+    if port and _server is None:
+        try:
+            _server = await asyncio.start_server(_handle, config_and_utils.METRICS_HOST, port)
+            log(f"Metrics at http://{config_and_utils.METRICS_HOST}:{port}/metrics")
+        except OSError as e:
+            log(f"Could not serve metrics on port {port}: {e}", level="WARNING")
+    if os.environ.get("APIFY_RUNNING") == "true" and config_and_utils.STATUS_INTERVAL > 0:
+        _ticker = asyncio.get_running_loop().create_task(_tick(config_and_utils.STATUS_INTERVAL))
+
+async def stop():
+    global _server, _ticker
+    if _ticker:
+        _ticker.cancel()
+        _ticker = None
+        try:
+            from apify import Actor
+            await Actor.set_status_message("Finished. " + _metrics.status_message(), is_terminal=True)
+        except Exception as e:
+            log(f"Status message error: {e}", level="DEBUG")
+    if _server:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -0,0 +1,284 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Local stand-in for the Meroshare web app and its JSON backend. It serves a
+# tiny single-page app exposing the same selectors and hash routes the browser
+# engine relies on, and the API routes used by the API engine. Any username
+# and password are accepted, so synthetic accounts can be generated freely.
+
+DPS = [{"id": 128, "code": "13700", "name": "BENCH CAPITAL LIMITED (13700)"}]
+BANKS = [{"id": 1, "code": "BB", "name": "Bench Bank Limited"}, {"id": 2, "code": "OB", "name": "Other Bank Limited"}]
+
+class MockState:
+    def __init__(self, issues=3, latency=0.0, error_rate=0.0):
+        self.issues = [
+            {
+                "companyShareId": 1000 + i,
+                "companyName": f"Bench Company {i + 1} Limited",
+                "scrip": f"BC{i + 1}",
+                "shareTypeName": "Ordinary Shares",
+                "shareGroupName": "Ordinary Shares",
+                "subGroup": "For General Public",
+            }
+            for i in range(issues)
+        ]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.applied = set()  # (username, companyShareId)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def issue_list(self, username):
+        return [{**issue, "action": "edit" if (username, issue["companyShareId"]) in self.applied else ""}
+                for issue in self.issues]
+
+APP_HTML = r"""<!doctype html>
+<html><head><meta charset="utf-8"><title>Meroshare (stand-in)</title></head>
+<body>
+<nav id="nav" style="display:none">
+  <a href="#/dashboard">Dashboard</a>
+  <a class="nav-link" href="#/asba">Apply for Issue</a>
+</nav>
+<div id="app"></div>
+<script>
+const API = "/api/meroShare";
+const app = document.getElementById("app");
+const token = () => sessionStorage.getItem("Authorization");
+
+async function api(method, path, body) {
+  const resp = await fetch(API + path, {
+    method, headers: {"Content-Type": "application/json", "Authorization": token() || ""},
+    body: body ? JSON.stringify(body) : undefined,
+  });
+  const data = await resp.json().catch(() => ({}));
+  return {ok: resp.ok, status: resp.status, data, headers: resp.headers};
+}
+
+function toast(message) {
+  const t = document.createElement("div");
+  t.className = "toast-message";
+  t.innerText = message;
+  document.body.appendChild(t);
+  setTimeout(() => t.remove(), 3000);
+}
+
+function renderLogin() {
+  document.getElementById("nav").style.display = "none";
+  app.innerHTML = `
+    <span class="select2-selection--single" id="dpSelect">Select DP</span>
+    <div id="dpSearch"></div>
+    <input id="username"><input id="password" type="password">
+    <button class="sign-in">Login</button>`;
+  let clientId = null;
+  let dpLookup = Promise.resolve();
+  document.getElementById("dpSelect").onclick = () => {
+    document.getElementById("dpSearch").innerHTML = '<input class="select2-search__field">';
+    const field = document.querySelector(".select2-search__field");
+    field.onkeydown = (e) => {
+      if (e.key !== "Enter") return;
+      dpLookup = (async () => {
+        const {data} = await api("GET", "/capital/");
+        const dp = data.find(d => d.code === field.value || d.name.toLowerCase().includes(field.value.toLowerCase()));
+        if (dp) { clientId = dp.id; document.getElementById("dpSelect").innerText = dp.name; }
+        document.getElementById("dpSearch").innerHTML = "";
+      })();
+    };
+  };
+  document.querySelector("button.sign-in").onclick = async () => {
+    await dpLookup;
+    const r = await api("POST", "/auth/", {clientId, username: username.value, password: password.value});
+    if (!r.ok) { toast(r.data.message || "Login failed"); return; }
+    sessionStorage.setItem("Authorization", r.headers.get("Authorization"));
+    location.hash = "#/dashboard";
+  };
+}
+
+async function renderAsba() {
+  app.innerHTML = "<p>Loading...</p>";
+  const r = await api("POST", "/companyShare/applicableIssue/", {page: 1, size: 200});
+  if (!r.ok) { app.innerHTML = "<p>Error loading issues</p>"; return; }
+  app.innerHTML = "";
+  for (const issue of r.data.object) {
+    const row = document.createElement("div");
+    row.className = "company-list";
+    const state = issue.action === "edit" ? "edit" : "apply";
+    row.innerHTML = `<div>${issue.companyName}</div><div>${issue.shareTypeName}</div>
+      <button>${state === "edit" ? "Edit" : "Apply"}</button>`;
+    row.querySelector("button").onclick = () => { location.hash = `#/asba/${state}/${issue.companyShareId}`; };
+    app.appendChild(row);
+  }
+}
+
+async function renderApply(issueId) {
+  app.innerHTML = `
+    <select id="selectBank"><option value="">Select bank</option></select>
+    <select id="accountNumber"><option value="">Select account</option></select>
+    <input id="appliedKitta"><input id="crnNumber">
+    <input type="checkbox" id="disclaimer">
+    <button id="proceed">Proceed</button>
+    <div id="pinBox"></div>`;
+  const banks = await api("GET", "/bank/");
+  const bankSelect = document.getElementById("selectBank");
+  for (const b of banks.data) bankSelect.insertAdjacentHTML("beforeend", `<option value="${b.id}">${b.name}</option>`);
+  let bankAccount = null;
+  bankSelect.onchange = async () => {
+    const accounts = await api("GET", "/bank/" + bankSelect.value);
+    const accSelect = document.getElementById("accountNumber");
+    accSelect.innerHTML = '<option value="">Select account</option>';
+    accounts.data.forEach((a, i) => accSelect.insertAdjacentHTML("beforeend", `<option value="${i}">${a.accountNumber}</option>`));
+    accSelect.onchange = () => { bankAccount = accounts.data[Number(accSelect.value)]; };
+  };
+  document.getElementById("proceed").onclick = () => {
+    document.getElementById("pinBox").innerHTML = '<input id="transactionPIN"><button id="applyBtn">Apply</button>';
+    document.getElementById("applyBtn").onclick = async () => {
+      const r = await api("POST", "/applicantForm/share/apply", {
+        companyShareId: String(issueId), bankId: bankSelect.value, appliedKitta: appliedKitta.value,
+        crnNumber: crnNumber.value, transactionPIN: transactionPIN.value,
+        accountNumber: bankAccount && bankAccount.accountNumber,
+      });
+      toast(r.data.message || ("Error " + r.status));
+    };
+  };
+}
+
+function route() {
+  const hash = location.hash || "#/login";
+  if (!token() && hash !== "#/login") { location.hash = "#/login"; return; }
+  if (hash !== "#/login") document.getElementById("nav").style.display = "";
+  const m = hash.match(/^#\/asba\/(apply|edit)\/(\d+)/);
+  if (hash === "#/login") renderLogin();
+  else if (m) renderApply(m[2]);
+  else if (hash.startsWith("#/asba")) renderAsba();
+  else app.innerHTML = "<h1>Dashboard</h1>";
+}
+window.addEventListener("hashchange", route);
+route();
+</script>
+</body></html>
+"""
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, data, headers=None):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return {}
+            try:
+                return json.loads(self.rfile.read(length))
+            except ValueError:
+                return {}
+
+        def username(self):
+            token = self.headers.get("Authorization") or ""
+            return token[len("tok-"):] if token.startswith("tok-") else None
+
+        def handle_any(self, method):
+            with state.lock:
+                state.requests += 1
+            if state.latency:
+                time.sleep(state.latency)
+            path = urlparse(self.path).path
+            body = self.read_json() if method == "POST" else {}
+
+            if path in ("/", "/index.html"):
+                page = APP_HTML.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+                return
+            if not path.startswith("/api/meroShare/"):
+                self.send_json(404, {"message": "Not found"})
+                return
+            if state.error_rate and random.random() < state.error_rate:
+                self.send_json(500, {"message": "Internal server error"})
+                return
+
+            route = path[len("/api/meroShare"):]
+            if route == "/capital/":
+                self.send_json(200, DPS)
+            elif route == "/auth/" and method == "POST":
+                if not body.get("username") or body.get("clientId") is None:
+                    self.send_json(401, {"message": "Invalid credentials"})
+                else:
+                    self.send_json(200, {"message": "Log in successful."}, {"Authorization": f"tok-{body['username']}"})
+            elif self.username() is None:
+                self.send_json(401, {"message": "Unauthorized"})
+            elif route == "/ownDetail/":
+                user = self.username()
+                self.send_json(200, {"name": user, "demat": f"13017000{abs(hash(user)) % 10**8:08d}", "boid": f"{abs(hash(user)) % 10**8:08d}"})
+            elif route == "/companyShare/applicableIssue/":
+                self.send_json(200, {"object": state.issue_list(self.username()), "totalCount": len(state.issues)})
+            elif route == "/bank/":
+                self.send_json(200, BANKS)
+            elif route.startswith("/bank/"):
+                bank_id = route.rsplit("/", 1)[-1]
+                self.send_json(200, [{"id": 7, "accountNumber": f"0{bank_id}00123456", "accountBranchId": 11, "accountTypeId": 1, "branchName": "Main"}])
+            elif route == "/applicantForm/share/apply" and method == "POST":
+                key = (self.username(), int(body.get("companyShareId") or 0))
+                if not body.get("transactionPIN"):
+                    self.send_json(400, {"message": "Wrong transaction PIN."})
+                elif key in state.applied:
+                    self.send_json(409, {"message": "You have already applied for this issue."})
+                else:
+                    with state.lock:
+                        state.applied.add(key)
+                    self.send_json(201, {"message": "Share has been applied successfully."})
+            else:
+                self.send_json(404, {"message": "Not found"})
+
+        def do_GET(self):
+            self.handle_any("GET")
+
+        def do_POST(self):
+            self.handle_any("POST")
+
+    return Handler
+
+def start_server(host="127.0.0.1", port=0, issues=3, latency=0.0, error_rate=0.0):
+    """Start the stand-in in a background thread. Returns (server, state); `server.server_port` is the bound port."""
+    state = MockState(issues=issues, latency=latency, error_rate=error_rate)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-meroshare", daemon=True).start()
+    return server, state
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local Meroshare stand-in server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--issues", type=int, default=3, help="Number of open issues")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API requests answered with HTTP 500")
+    args = parser.parse_args()
+
+    server, _ = start_server(port=args.port, issues=args.issues, latency=args.latency, error_rate=args.error_rate)
+    print(f"Stand-in running at http://127.0.0.1:{server.server_port}")
+    print(f"Use MEROSHARE_URL=http://127.0.0.1:{server.server_port} MEROSHARE_API_URL=http://127.0.0.1:{server.server_port}/api")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
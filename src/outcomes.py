@@ -0,0 +1,95 @@
+import asyncio
+import weakref
+import waits
+
+# Outcome of one application, reported by the site as a toast. Each page gets
+# a single listener, registered once; a submission arms it with `expect()`
+# right before clicking Apply, so a toast can only ever be attributed to the
+# IPO being submitted at that moment.
+
+SUCCESS = "success"
+WRONG_PIN = "wrong_pin"
+ALREADY_APPLIED = "already_applied"
+ERROR = "error"
+TIMEOUT = "timeout"
+# Not reported by the site: every pending IPO of an account whose credentials were rejected
+LOGIN_REJECTED = "login_rejected"
+
+# Installed as an init script (survives reloads) and evaluated once for the current document
+TOAST_OBSERVER_JS = """
+(() => {
+    const install = () => {
+        if (window.__toastObserver) return;
+        const selector = '.toast-message, .toastr, [role="alert"]';
+        window.__toastObserver = new MutationObserver((mutations) => {
+            for (const mutation of mutations) {
+                for (const node of mutation.addedNodes) {
+                    if (node.nodeType !== 1) continue;
+                    const toasts = node.matches(selector) ? [node] : Array.from(node.querySelectorAll(selector));
+                    for (const t of toasts) window.reportToast(t.innerText);
+                }
+            }
+        });
+        window.__toastObserver.observe(document.body, { childList: true, subtree: true });
+    };
+    // As an init script this runs before <body> exists
+    if (document.body) install();
+    else document.addEventListener("DOMContentLoaded", install, { once: true });
+})();
+"""
+
+def classify(message):
+    text = (message or "").lower()
+    if "pin" in text and ("wrong" in text or "invalid" in text or "incorrect" in text):
+        return WRONG_PIN
+    if "already" in text:
+        return ALREADY_APPLIED
+    if "successfully" in text:
+        return SUCCESS
+    return ERROR
+
+def result(ipo, outcome, message=""):
+    return {"company": ipo['company'], "outcome": outcome, "message": message}
+
+class OutcomeChannel:
+    def __init__(self, page):
+        self.page = page
+        self.pending = None  # (ipo, future) for the submission in flight
+
+    async def install(self):
+        await self.page.expose_binding("reportToast", self._on_toast)
+        await self.page.add_init_script(TOAST_OBSERVER_JS)
+        await self.page.evaluate(TOAST_OBSERVER_JS)
+
+    def _on_toast(self, source, text):
+        message = (text or "").strip()
+        if not message or self.pending is None:
+            return
+        ipo, future = self.pending
+        if not future.done():
+            future.set_result(result(ipo, classify(message), message))
+
+    def expect(self, ipo):
+        """Arm the channel for `ipo`; call right before the click that submits it."""
+        self.pending = (ipo, asyncio.get_running_loop().create_future())
+
+    async def wait(self, timeout=None):
+        """Outcome of the armed submission, or a TIMEOUT result."""
+        ipo, future = self.pending
+        try:
+            return await asyncio.wait_for(future, (timeout or waits.profile()["outcome_timeout"]) / 1000)
+        except asyncio.TimeoutError:
+            return result(ipo, TIMEOUT)
+        finally:
+            self.pending = None
+
+_channels = weakref.WeakKeyDictionary()
+
+async def outcome_channel(page):
+    """The page's channel, installing the listener on first use."""
+    channel = _channels.get(page)
+    if channel is None:
+        channel = OutcomeChannel(page)
+        await channel.install()
+        _channels[page] = channel
+    return channel
@@ -0,0 +1,119 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from config_and_utils import get_log_context, log
+
+# Timing spans for each stage of a run, summarised into a report at the end.
+# Spans pick up the account/IPO from the log context, so call sites only name the stage.
+
+REPORT_FILE = os.environ.get("RUN_REPORT_FILE", "run_report.json")
+REPORT_KEY = "RUN_REPORT"
+
+SPANS = []
+# "earlier" is the time spent in the earlier part of a resumed run
+RUN = {"started": time.time(), "earlier": 0.0}
+
+class Span:
+    def __init__(self, stage, account, ipo):
+        self.stage = stage
+        self.account = account
+        self.ipo = ipo
+        self.ok = True
+        self.record = None
+
+    def fail(self):
+        """Mark the stage as failed when the step reports failure without raising."""
+        self.ok = False
+        if self.record:
+            self.record["ok"] = False
+
+@contextmanager
+def span(stage, account=None, ipo=None):
+    ctx = get_log_context()
+    s = Span(stage, account or ctx.get("account"), ipo or ctx.get("ipo"))
+    start = time.perf_counter()
+    try:
+        yield s
+    except BaseException:
+        s.ok = False
+        raise
+    finally:
+        s.record = {
+            "stage": s.stage,
+            "account": s.account,
+            "ipo": s.ipo,
+            "seconds": round(time.perf_counter() - start, 3),
+            "ok": s.ok,
+        }
+        SPANS.append(s.record)
+
+def start_run():
+    SPANS.clear()
+    RUN["started"] = time.time()
+    RUN["earlier"] = 0.0
+
+def elapsed():
+    """Seconds this run has been working, including the earlier part of a resumed run (not the downtime)."""
+    return time.time() - RUN["started"] + RUN["earlier"]
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return round(ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo), 3)
+
+def build_report(extra=None):
+    wall = elapsed()
+    stages = {}
+    for s in SPANS:
+        stages.setdefault(s["stage"], []).append(s)
+    summary = {}
+    for stage, spans in stages.items():
+        durations = [s["seconds"] for s in spans]
+        summary[stage] = {
+            "count": len(spans),
+            "failures": sum(1 for s in spans if not s["ok"]),
+            "p50": percentile(durations, 50),
+            "p95": percentile(durations, 95),
+            "total": round(sum(durations), 3),
+        }
+    accounts = {s["account"] for s in SPANS if s["account"]}
+    report = {
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(RUN["started"])),
+        "wall_seconds": round(wall, 3),
+        "accounts": len(accounts),
+        "accounts_per_minute": round(len(accounts) / (wall / 60), 2) if wall > 0 else None,
+        "failures_by_stage": {k: v["failures"] for k, v in summary.items() if v["failures"]},
+        "stages": summary,
+    }
+    if extra:
+        report.update(extra)
+    return report
+
+def format_report(report):
+    lines = [f"Run took {report['wall_seconds']:.1f}s for {report['accounts']} accounts "
+             f"({report['accounts_per_minute']} accounts/min)."]
+    for stage, st in report["stages"].items():
+        lines.append(f"  {stage:<15} n={st['count']:<4} p50={st['p50']}s p95={st['p95']}s failures={st['failures']}")
+    return "\n".join(lines)
+
+async def write_report(extra=None, path=REPORT_FILE):
+    """Write the run report to `path` and, on Apify, to the default key-value store."""
+    report = build_report(extra)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({**report, "spans": SPANS}, f, indent=2)
+    except Exception as e:
+        log(f"Could not write {path}: {e}")
+    if os.environ.get("APIFY_RUNNING") == "true":
+        try:
+            from apify import Actor
+            await Actor.set_value(REPORT_KEY, {**report, "spans": SPANS})
+        except Exception as e:
+            log(f"Could not store run report on Apify: {e}")
+    log(format_report(report))
+    return report
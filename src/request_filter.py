@@ -0,0 +1,56 @@
+from urllib.parse import urlparse
+import config_and_utils
+
+# Aborts requests the bot never looks at (images, fonts, media) and anything
+# outside the Meroshare/CDSC hosts, such as analytics. Blocked requests never
+# reach us, so bytes saved are estimated from typical sizes per resource type.
+TYPICAL_BYTES = {"image": 30_000, "font": 60_000, "stylesheet": 40_000, "media": 200_000}
+DEFAULT_TYPICAL_BYTES = 10_000
+
+STATS = {"blocked": 0, "allowed": 0, "bytes_saved": 0, "by_type": {}}
+
+def allowed_hosts():
+    hosts = {urlparse(url).hostname for url in (config_and_utils.APP_URL, config_and_utils.API_URL)}
+    hosts.update(h.strip() for h in config_and_utils.ALLOWED_HOSTS.split(",") if h.strip())
+    return {h for h in hosts if h}
+
+def is_allowed_host(host, hosts):
+    return any(host == h or host.endswith("." + h) for h in hosts)
+
+def blocked_types():
+    return {t.strip() for t in config_and_utils.BLOCKED_RESOURCE_TYPES.split(",") if t.strip()}
+
+def blocked_kind(request, types, hosts):
+    """Why `request` is blocked ("third-party" or its resource type), or None if it may go through."""
+    host = urlparse(request.url).hostname or ""
+    if config_and_utils.BLOCK_THIRD_PARTY and host and not is_allowed_host(host, hosts):
+        return "third-party"
+    if request.resource_type in types:
+        return request.resource_type
+    return None
+
+async def install_request_filter(context):
+    """Route every request of `context` through the filter (no-op when blocking is disabled)."""
+    types = blocked_types()
+    if not types and not config_and_utils.BLOCK_THIRD_PARTY:
+        return
+    hosts = allowed_hosts()
+
+    async def handle(route):
+        request = route.request
+        kind = blocked_kind(request, types, hosts)
+        if kind:
+            STATS["blocked"] += 1
+            STATS["by_type"][kind] = STATS["by_type"].get(kind, 0) + 1
+            STATS["bytes_saved"] += TYPICAL_BYTES.get(request.resource_type, DEFAULT_TYPICAL_BYTES)
+            await route.abort()
+        else:
+            STATS["allowed"] += 1
+            await route.continue_()
+
+    await context.route("**/*", handle)
+
+def summary():
+    by_type = ", ".join(f"{k}: {v}" for k, v in sorted(STATS["by_type"].items())) or "none"
+    return (f"Request filter: blocked {STATS['blocked']} of {STATS['blocked'] + STATS['allowed']} requests "
+            f"(~{STATS['bytes_saved'] / 1_000_000:.1f} MB saved; {by_type}).")
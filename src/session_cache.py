@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import time
+import config_and_utils
+from config_and_utils import log
+import kv_storage
+
+# Logged-in sessions persisted per account so later runs (and later accounts'
+# retries) can skip the login form. Stored as JSON files locally, or in a named
+# key-value store on Apify because the container filesystem does not survive runs.
+
+SESSION_DIR = "sessions"
+SESSION_STORE_NAME = "meroshare-sessions"
+
+STATS = {"hits": 0, "misses": 0, "expired": 0}
+
+def _key(username, kind):
+    # KV store keys only allow a small character set; hashing also keeps usernames out of file names.
+    return f"{kind}-" + hashlib.sha1(username.encode("utf-8")).hexdigest()
+
+async def _read(key):
+    return await kv_storage.read(os.path.join(SESSION_DIR, key + ".json"), SESSION_STORE_NAME, key)
+
+async def _write(key, value):
+    await kv_storage.write(os.path.join(SESSION_DIR, key + ".json"), SESSION_STORE_NAME, key, value)
+
+async def load_session(username, kind="browser"):
+    """Return the cached session for `username` if it is younger than the TTL, else None."""
+    ttl = config_and_utils.SESSION_TTL
+    if ttl <= 0:
+        return None
+    try:
+        entry = await _read(_key(username, kind))
+    except Exception as e:
+        log(f"Session cache read error: {e}")
+        entry = None
+    if not entry:
+        STATS["misses"] += 1
+        return None
+    if time.time() - entry.get("saved_at", 0) > ttl:
+        STATS["expired"] += 1
+        STATS["misses"] += 1
+        return None
+    return entry
+
+async def save_session(username, data, kind="browser"):
+    if config_and_utils.SESSION_TTL <= 0:
+        return
+    try:
+        await _write(_key(username, kind), {"saved_at": time.time(), **data})
+    except Exception as e:
+        log(f"Session cache write error: {e}")
+
+async def drop_session(username, kind="browser"):
+    try:
+        await _write(_key(username, kind), None)
+    except Exception:
+        pass
+
+def record_hit():
+    STATS["hits"] += 1
+
+def record_stale():
+    """A cached session was loaded but the server no longer accepted it."""
+    STATS["expired"] += 1
+    STATS["misses"] += 1
+
+def summary():
+    return f"Session cache: {STATS['hits']} hits, {STATS['misses']} misses ({STATS['expired']} expired)."
+
+async def capture_browser_session(page):
+    return {
+        "storage_state": await page.context.storage_state(),
+        "session_storage": await page.evaluate("() => JSON.stringify(sessionStorage)"),
+    }
+
+async def restore_browser_session(page, entry):
+    """Put cookies and web storage from `entry` back into a fresh page.
+
+    The storage script is added to the page, not the context, so it does not
+    follow a recycled context to the next account.
+    """
+    state = entry.get("storage_state") or {}
+    if state.get("cookies"):
+        await page.context.add_cookies(state["cookies"])
+    local = {}
+    for origin in state.get("origins", []):
+        for item in origin.get("localStorage", []):
+            local[item["name"]] = item["value"]
+    session = json.loads(entry.get("session_storage") or "{}")
+    # Only fill keys that are missing, so a token refreshed later in the run is not overwritten.
+    await page.add_init_script(f"""
+        (() => {{
+            const fill = (store, items) => {{
+                for (const [k, v] of Object.entries(items)) if (store.getItem(k) === null) store.setItem(k, v);
+            }};
+            fill(window.localStorage, {json.dumps(local)});
+            fill(window.sessionStorage, {json.dumps(session)});
+        }})();
+    """)
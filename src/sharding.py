@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import sys
+import config_and_utils
+from config_and_utils import log
+
+# Splits the account list across several worker processes (locally) or several
+# Apify runs. A coordinator runs discovery once, hands the IPO list to every
+# shard and merges their history records and run reports afterwards.
+
+SHARD_DIR = "shards"
+
+def select_shard(accounts, shard_index, shard_count):
+    """Every `shard_count`-th account starting at `shard_index` (round-robin keeps shards even)."""
+    if not shard_count or shard_count <= 1:
+        return accounts
+    return [acc for i, acc in enumerate(accounts) if i % shard_count == shard_index]
+
+async def merge_history_records(records):
+    """Add shard records to this process's history; duplicates are dropped by the store index."""
+    from history_tracker import get_store, flush_history, save_history
+    store = get_store()
+    added = [r for r in records if r.get('Username') and r.get('Company') and store.add(r)]
+    # On Apify this pushes them to the coordinator's dataset, then writes the history store once
+    # for all shards (they leave it alone, so they never overwrite each other's records).
+    await flush_history()
+    await save_history()
+    return len(added)
+
+def merge_report_spans(reports):
+    import perf_report
+    for report in reports:
+        perf_report.SPANS.extend((report or {}).get("spans", []))
+
+async def run_local(shard_count, headless=False, max_concurrency=1, mode="browser"):
+    """Coordinate `shard_count` local worker processes running `cli.py run`."""
+    import perf_report
+    from bot_engine import discover_only
+    from history_tracker import HistoryStore, get_store
+
+    perf_report.start_run()
+    log(f"=== Sharded run: {shard_count} worker processes ===")
+    available_ipos = await discover_only(headless=headless, mode=mode)
+    if not available_ipos:
+        log("No available IPOs found or error during discovery.")
+        return
+
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    ipos_file = os.path.abspath(os.path.join(SHARD_DIR, "ipos.json"))
+    with open(ipos_file, "w", encoding="utf-8") as f:
+        json.dump(available_ipos, f)
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+    # Every worker starts from a copy of the full history, so it skips pairs applied in earlier runs
+    seeded = len(get_store().query())
+    procs = []
+    for i in range(shard_count):
+        history_file = os.path.abspath(os.path.join(SHARD_DIR, f"history_{i}.csv"))
+        get_store().export_csv(history_file)
+        env = {
+            **os.environ,
+            "HISTORY_FILE": history_file,
+            "HISTORY_DB": "",
+            "RUN_REPORT_FILE": os.path.abspath(os.path.join(SHARD_DIR, f"report_{i}.json")),
+            "RUN_STATE_FILE": os.path.abspath(os.path.join(SHARD_DIR, f"run_state_{i}.json")),
+            # One metrics port per worker, after the configured one
+            "METRICS_PORT": str(config_and_utils.METRICS_PORT + 1 + i if config_and_utils.METRICS_PORT else 0),
+            # The overall rate; each worker takes its share of it
+            "RATE_LIMIT": str(config_and_utils.RATE_LIMIT),
+        }
+        args = [sys.executable, script, "run", "--accounts", os.path.abspath(config_and_utils.ACCOUNTS_FILE), "--shard-index", str(i), "--shard-count", str(shard_count),
+                "--ipos-file", ipos_file, "--concurrency", str(max_concurrency), "--mode", mode,
+                "--timing", config_and_utils.TIMING_PROFILE, "--prefetch", str(config_and_utils.LOGIN_PREFETCH)]
+        if headless:
+            args.append("--headless")
+        if config_and_utils.LOW_MEMORY:
+            args.append("--low-memory")
+        if config_and_utils.MEMORY_LIMIT_MB:
+            # The workers share this machine's memory
+            args += ["--memory-limit", str(config_and_utils.MEMORY_LIMIT_MB // shard_count)]
+        procs.append(await asyncio.create_subprocess_exec(*args, env=env))
+
+    codes = await asyncio.gather(*(p.wait() for p in procs))
+    for i, code in enumerate(codes):
+        if code:
+            log(f"Shard {i} exited with code {code}.", level="WARNING")
+
+    # Shards only ever append to their own copies, so the records after the seeded ones are new
+    records, reports = [], []
+    for i in range(shard_count):
+        records.extend(HistoryStore(csv_path=os.path.join(SHARD_DIR, f"history_{i}.csv")).query()[seeded:])
+        report_file = os.path.join(SHARD_DIR, f"report_{i}.json")
+        if os.path.exists(report_file):
+            with open(report_file, "r", encoding="utf-8") as f:
+                reports.append(json.load(f))
+    added = await merge_history_records(records)
+    log(f"Merged {added} new history records from {shard_count} shards.")
+    merge_report_spans(reports)
+    await perf_report.write_report(extra={"shards": shard_count, "shard_exit_codes": codes})
+
+async def run_apify(shard_count, actor_input, headless=True, mode="browser"):
+    """Coordinate `shard_count` runs of this same actor on Apify and merge their outputs."""
+    from apify import Actor
+    import perf_report
+    from bot_engine import discover_only
+
+    perf_report.start_run()
+    log(f"=== Sharded run: {shard_count} Apify runs ===")
+    available_ipos = actor_input.get("ipos") or await discover_only(headless=headless, mode=mode)
+    if not available_ipos:
+        log("No available IPOs found or error during discovery.")
+        return
+
+    actor_id = Actor.configuration.actor_id
+    child_inputs = [{**actor_input, "shard_index": i, "shard_count": shard_count, "ipos": available_ipos,
+                     "rate_limit": config_and_utils.RATE_LIMIT}
+                    for i in range(shard_count)]
+    runs = await asyncio.gather(*(Actor.call(actor_id, run_input=inp) for inp in child_inputs), return_exceptions=True)
+
+    records, reports = [], []
+    client = Actor.apify_client
+    for i, run in enumerate(runs):
+        if isinstance(run, Exception) or run is None:
+            log(f"Shard {i} run failed: {run}", level="WARNING")
+            continue
+        items = await client.dataset(run.default_dataset_id).list_items()
+        records.extend(items.items)
+        record = await client.key_value_store(run.default_key_value_store_id).get_record(perf_report.REPORT_KEY)
+        if record:
+            reports.append(record.get("value") if isinstance(record, dict) else getattr(record, "value", None))
+    added = await merge_history_records(records)
+    log(f"Merged {added} new history records from {shard_count} shards.")
+    merge_report_spans(reports)
+    await perf_report.write_report(extra={"shards": shard_count})
@@ -0,0 +1,211 @@
+import asyncio
+import random
+import time
+from collections import deque
+from urllib.parse import urlparse
+import config_and_utils
+from config_and_utils import log
+import metrics
+import outcomes
+import waits
+
+# Shared pacing for everything that hits the Meroshare servers. A token bucket
+# caps navigations/submissions (browser) and requests (API) per second. Its
+# rate halves on failed or slow responses and creeps back up on healthy ones.
+# When the recent error rate spikes, a circuit breaker holds every worker
+# until a cooldown has passed.
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def take(self):
+        """Wait for one token; returns the seconds spent waiting."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def slow_down(self):
+        if self.max_rate > 0:
+            self.rate = max(self.max_rate / 10, self.rate / 2)
+
+    def speed_up(self):
+        if self.max_rate > 0:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class CircuitBreaker:
+    def __init__(self, error_rate, cooldown, window=20, min_samples=10):
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.open_until = 0.0
+        self.opened = 0
+
+    def record(self, ok):
+        self.outcomes.append(ok)
+        if self.error_rate <= 0 or len(self.outcomes) < self.min_samples or self.is_open():
+            return
+        failures, samples = self.outcomes.count(False), len(self.outcomes)
+        if failures / samples >= self.error_rate:
+            self.open_until = time.monotonic() + self.cooldown
+            self.opened += 1
+            # Start the next window fresh, so one more failure after the pause does not trip it again at once
+            self.outcomes.clear()
+            log(f"Server errors in {failures} of the last {samples} requests. Pausing all workers for {self.cooldown}s.", level="WARNING")
+
+    def is_open(self):
+        return time.monotonic() < self.open_until
+
+    async def wait(self):
+        waited = 0.0
+        while self.is_open():
+            delay = self.open_until - time.monotonic()
+            waited += delay
+            await asyncio.sleep(delay)
+        return waited
+
+class Scheduler:
+    def __init__(self, rate, burst, slow_after, error_rate, cooldown):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(error_rate, cooldown)
+        self.slow_after = slow_after
+        self.stats = {"requests": 0, "failures": 0, "slow": 0, "waited_seconds": 0.0, "retries": 0, "requeued": 0}
+
+    async def acquire(self):
+        """Call before each navigation, submission or API request."""
+        waited = await self.breaker.wait()
+        waited += await self.bucket.take()
+        self.stats["requests"] += 1
+        self.stats["waited_seconds"] += waited
+
+    def record(self, ok, seconds=None):
+        """Feed back how the server answered; failures and slow answers slow everyone down."""
+        slow = seconds is not None and seconds > self.slow_after
+        if not ok:
+            self.stats["failures"] += 1
+        if slow:
+            self.stats["slow"] += 1
+        if ok and not slow:
+            self.bucket.speed_up()
+        else:
+            self.bucket.slow_down()
+        self.breaker.record(ok)
+
+    def backoff(self, attempt):
+        """Delay before retry number `attempt` (0-based): exponential with jitter, longer while the rate is reduced."""
+        stretch = self.bucket.max_rate / self.bucket.rate if self.bucket.rate > 0 else 1
+        return waits.profile()["retry_delay"] * (2 ** attempt) * stretch * random.uniform(0.5, 1.5)
+
+    def summary(self):
+        s = self.stats
+        return (f"Throttle: {s['requests']} paced requests, {s['failures']} failed, {s['slow']} slow, "
+                f"{s['waited_seconds']:.1f}s waiting, breaker opened {self.breaker.opened}x, {s['retries']} retried clicks, {s['requeued']} requeued.")
+
+    def report(self):
+        return {**self.stats, "waited_seconds": round(self.stats["waited_seconds"], 3),
+                "breaker_opened": self.breaker.opened, "rate": self.bucket.rate}
+
+_scheduler = None
+_shares = 1
+
+def reset(shares=1):
+    """Start a run with fresh pacing state (and a bucket bound to the current event loop).
+
+    `shares` is the number of shards running at once; each gets that fraction of RATE_LIMIT.
+    """
+    global _scheduler, _shares
+    _scheduler = None
+    _shares = max(1, shares)
+
+def scheduler():
+    """The run's shared scheduler, built from config on first use."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(
+            rate=config_and_utils.RATE_LIMIT / _shares,
+            burst=config_and_utils.RATE_BURST,
+            slow_after=config_and_utils.SLOW_RESPONSE,
+            error_rate=config_and_utils.BREAKER_ERROR_RATE,
+            cooldown=config_and_utils.BREAKER_COOLDOWN,
+        )
+    return _scheduler
+
+def watch_responses(context):
+    """Feed the scheduler from a browser context's own traffic to the Meroshare hosts."""
+    hosts = {urlparse(url).hostname for url in (config_and_utils.APP_URL, config_and_utils.API_URL)}
+
+    def ours(request):
+        return request.resource_type in ("xhr", "fetch", "document") and urlparse(request.url).hostname in hosts
+
+    def on_response(response):
+        if not ours(response.request):
+            return
+        timing = response.request.timing or {}
+        # responseStart is milliseconds from the request start to the first response byte
+        seconds = timing["responseStart"] / 1000 if timing.get("responseStart", -1) > 0 else None
+        scheduler().record(response.status < 500 and response.status != 429, seconds)
+
+    def on_failed(request):
+        if ours(request):
+            scheduler().record(False)
+
+    context.on("response", on_response)
+    context.on("requestfailed", on_failed)
+
+RETRYABLE = (outcomes.ERROR, outcomes.TIMEOUT)
+
+def requeue(accounts, results, available_ipos):
+    """(account, ipos) for every account whose last attempt at an IPO ended in an error or timeout."""
+    by_company = {ipo['company']: ipo for ipo in available_ipos}
+    pending = []
+    for acc, res in zip(accounts, results):
+        ipos = [by_company[r['company']] for r in res if r['outcome'] in RETRYABLE and r['company'] in by_company]
+        if ipos:
+            pending.append((acc, ipos))
+    return pending
+
+async def run_with_requeue(accounts, available_ipos, run_one):
+    """Run `run_one(acc, ipos, attempt)` for every account, then again for failed pairs.
+
+    Retries go through the same scheduler, so they wait out an open breaker.
+    Returns each account's final results, in account order.
+    """
+    metrics.plan(accounts)
+
+    async def tracked(acc, ipos, attempt):
+        res = await run_one(acc, ipos, attempt)
+        metrics.account_finished(acc, res)
+        return res
+
+    results = list(await asyncio.gather(*(tracked(acc, available_ipos, 0) for acc in accounts)))
+    index = {acc['username']: i for i, acc in enumerate(accounts)}
+    for attempt in range(1, config_and_utils.REQUEUE_ATTEMPTS + 1):
+        retry = requeue(accounts, results, available_ipos)
+        if not retry:
+            break
+        count = sum(len(ipos) for _, ipos in retry)
+        scheduler().stats["requeued"] += count
+        log(f"Requeueing {count} failed applications (attempt {attempt}/{config_and_utils.REQUEUE_ATTEMPTS})...")
+        retried = await asyncio.gather(*(tracked(acc, ipos, attempt) for acc, ipos in retry))
+        for (acc, _), res in zip(retry, retried):
+            i = index[acc['username']]
+            done = {r['company'] for r in res}
+            results[i] = [r for r in results[i] if r['company'] not in done] + res
+    return results
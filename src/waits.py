@@ -0,0 +1,52 @@
+import asyncio
+import config_and_utils
+
+# Condition-based waits used instead of fixed sleeps. Each profile only bounds
+# how long a condition may take; on a good connection nothing waits longer
+# than the page itself needs.
+TIMING_PROFILES = {
+    "fast": {
+        "slow_mo": 0,
+        "timeout": 15000,        # ms, per condition
+        "outcome_timeout": 15000,  # ms, waiting for the toast after submit
+        "retry_delay": 0.5,      # s, between click retries
+        "apply_deadline": 90,    # s, hard cap for one application
+    },
+    "safe": {
+        "slow_mo": 200,
+        "timeout": 30000,
+        "outcome_timeout": 30000,
+        "retry_delay": 2,
+        "apply_deadline": 180,
+    },
+}
+
+def profile():
+    return TIMING_PROFILES.get(config_and_utils.TIMING_PROFILE, TIMING_PROFILES["safe"])
+
+async def wait_for_options(page, selector, min_count=1, timeout=None):
+    """Wait until `selector` has at least `min_count` options with a non-empty value."""
+    await page.wait_for_function(
+        "([sel, n]) => document.querySelectorAll(sel + ' option[value]:not([value=\"\"])').length >= n",
+        arg=[selector, min_count],
+        timeout=timeout or profile()["timeout"],
+    )
+
+async def wait_for_application_page(page, timeout=None):
+    """Wait until an apply page has its bank dropdown, or an edit page has loaded."""
+    try:
+        await page.wait_for_function(
+            "() => location.href.includes('/asba/edit/') || !!document.querySelector('#selectBank')",
+            timeout=timeout or profile()["timeout"],
+        )
+        return True
+    except Exception:
+        return False
+
+async def with_deadline(coro, seconds=None):
+    """Run `coro` under the profile's hard deadline; returns None on timeout."""
+    try:
+        return await asyncio.wait_for(coro, seconds or profile()["apply_deadline"])
+    except asyncio.TimeoutError:
+        config_and_utils.log("Step exceeded its hard timeout. Moving on.")
+        return None
@@ -0,0 +1,152 @@
+import asyncio
+import time
+import config_and_utils
+from config_and_utils import log, set_log_context, flush_account_state
+import discovery_cache
+from history_tracker import flush_history, save_history
+import perf_report
+import session_cache
+import throttle
+from perf_report import span
+
+# Long-running mode. The browser (or the HTTP pool in API mode) and one logged-in
+# discovery session stay open, and the issue list is polled with a single
+# applicableIssue request. As soon as an issue ID shows up that has not been
+# seen yet, every eligible account is processed on the warm browser.
+
+class ApiPoller:
+    """Polls the issue list over the JSON backend with a kept-alive session."""
+
+    def __init__(self, http, account, base_url=None):
+        from api_engine import MeroshareApiClient
+        self.client = MeroshareApiClient(http, base_url)
+        self.account = account
+
+    async def poll(self):
+        """Open issues, or None when the check itself failed."""
+        from api_engine import ApiError, api_login
+        set_log_context(stage="poll")
+        for attempt in range(2):
+            if self.client.token is None and not await api_login(self.client, self.account):
+                return None
+            try:
+                with span("poll", account=self.account['name']):
+                    return await self.client.applicable_issues()
+            except ApiError as e:
+                # Most likely an expired token: drop it and log in once more
+                log(f"Poll failed ({e}). Logging in again.", level="DEBUG")
+                await session_cache.drop_session(self.account['username'], kind="api")
+                self.client.token = None
+            except Exception as e:
+                log(f"Poll error: {e}")
+                return None
+        return None
+
+class PagePoller:
+    """Fallback for browser mode: reloads the ASBA page on a kept-open logged-in page."""
+
+    def __init__(self, browser, account):
+        self.browser = browser
+        self.account = account
+        self.context = None
+        self.page = None
+
+    async def poll(self):
+        from bot_engine import open_context
+        from application_logic import login_with_cache
+        from ipo_discovery import discover_available_ipos
+        set_log_context(stage="poll")
+        try:
+            if self.page is None:
+                self.context = await open_context(self.browser, self.account['username'])
+                self.page = await self.context.new_page()
+                if not await login_with_cache(self.page, self.account):
+                    await self.close()
+                    return None
+            with span("poll", account=self.account['name']):
+                return await discover_available_ipos(self.page)
+        except Exception as e:
+            log(f"Poll error: {e}")
+            await self.close()
+            return None
+
+    async def close(self):
+        if self.context:
+            await self.context.close()
+        self.context = self.page = None
+
+async def watch_loop(pollers, apply, interval, duration=0):
+    """Poll until `duration` seconds have passed (0 = forever) and call `apply(ipos)` when new issues open."""
+    deadline = time.monotonic() + duration if duration > 0 else None
+    seen = set()
+    polls = 0
+    while True:
+        ipos = None
+        for poller in pollers:
+            ipos = await poller.poll()
+            if ipos is not None:
+                break
+        polls += 1
+
+        if ipos is None:
+            log("Could not read the issue list this round.", level="WARNING")
+        else:
+            new = [ipo for ipo in ipos if (ipo.get('issue_id') or ipo['company']) not in seen]
+            seen.update(ipo.get('issue_id') or ipo['company'] for ipo in ipos)
+            if new:
+                for ipo in new:
+                    log(f"New issue open: {ipo['company']}")
+                await discovery_cache.save_ipos(ipos)
+                # The whole open list is handed over, so accounts that failed an earlier issue retry it too;
+                # anything already in history is skipped before login.
+                applied = await apply(discovery_cache.shared_ipos(ipos))
+                log(f"Processed {applied} applications for {len(new)} new issues.")
+                flush_account_state()
+                await flush_history()
+                # Watch mode is not checkpointed, so nothing else saves the store while it runs
+                await save_history()
+                await perf_report.write_report(extra={"watch": {"polls": polls, "issues_seen": len(seen)},
+                                                       "throttle": throttle.scheduler().report()})
+            else:
+                log(f"No new issues ({len(ipos)} open).", level="DEBUG")
+
+        if deadline is not None and time.monotonic() + interval > deadline:
+            log(f"Watch finished after {polls} polls.")
+            return polls
+        await asyncio.sleep(interval)
+
+async def watch(accounts, headless=False, max_concurrency=1, mode="browser", interval=None, duration=None, base_url=None):
+    """Keep a warm browser/session and apply for new issues as soon as they open."""
+    from api_engine import http_client
+    interval = interval or config_and_utils.WATCH_INTERVAL
+    duration = config_and_utils.WATCH_DURATION if duration is None else duration
+    if not accounts:
+        log("No active accounts found in accounts.csv")
+        return
+    log(f"=== Watch mode: polling every {interval}s ({mode} mode) ===")
+
+    async with http_client(max_concurrency) as http:
+        api_poller = ApiPoller(http, accounts[0], base_url)
+        if mode == "api":
+            import api_engine
+
+            async def apply(ipos):
+                return await api_engine.apply_all(http, accounts, ipos, max_concurrency, base_url=base_url)
+
+            return await watch_loop([api_poller], apply, interval, duration)
+
+        from playwright.async_api import async_playwright
+        import bot_engine
+        import memory
+        async with async_playwright() as p:
+            browser = await memory.launch_browser(p, headless)
+            page_poller = PagePoller(browser, accounts[0])
+
+            async def apply(ipos):
+                return await bot_engine.apply_all(browser, accounts, ipos, max_concurrency)
+
+            try:
+                return await watch_loop([api_poller, page_poller], apply, interval, duration)
+            finally:
+                await page_poller.close()
+                await browser.close()